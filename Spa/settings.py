@@ -24,6 +24,9 @@ EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL') 
+EMAIL_TIMEOUT = float(os.getenv('EMAIL_TIMEOUT', '10'))
+EMAIL_QUEUE = os.getenv('EMAIL_QUEUE', 'True').lower() in ('true', '1')
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))
 
 DATABASE_STRING = os.getenv('DATABASE_STRING') 
 
@@ -32,6 +35,42 @@ IMAGEKIT_PUBLIC_KEY = os.getenv('IMAGEKIT_PUBLIC_KEY')
 IMAGEKIT_URL_ENDPOINT = os.getenv('IMAGEKIT_URL_ENDPOINT')
 
 BASE_URL = os.getenv('BASE_URL')
+
+THERAPIST_SEARCH_SNAPSHOT = os.getenv("THERAPIST_SEARCH_SNAPSHOT", "True").lower() in ("true", "1")
+THERAPIST_SEARCH_SNAPSHOT_TTL = int(os.getenv("THERAPIST_SEARCH_SNAPSHOT_TTL", "300"))
+
+KAFKA_BACKEND = os.getenv("KAFKA_BACKEND", "kafka")
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092").split(",")
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "65536"))
+KAFKA_COMPRESSION_TYPE = os.getenv("KAFKA_COMPRESSION_TYPE", "gzip")
+KAFKA_MAX_BLOCK_MS = int(os.getenv("KAFKA_MAX_BLOCK_MS", "1000"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+DISPATCH_RADIUS_KM = float(os.getenv("DISPATCH_RADIUS_KM", "15"))
+DISPATCH_FANOUT = int(os.getenv("DISPATCH_FANOUT", "3"))
+
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "False").lower() in ("true", "1")
+CHAT_WRITE_BEHIND_INTERVAL = float(os.getenv("CHAT_WRITE_BEHIND_INTERVAL", "0.5"))
+CHAT_WRITE_BEHIND_MAX_BATCH = int(os.getenv("CHAT_WRITE_BEHIND_MAX_BATCH", "200"))
+CHAT_WRITE_BEHIND_MAX_PENDING = int(os.getenv('CHAT_WRITE_BEHIND_MAX_PENDING', '10000'))
+CHAT_WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('CHAT_WRITE_BEHIND_MAX_ATTEMPTS', '5'))
+CHAT_READ_RECEIPT_DELAY = float(os.getenv("CHAT_READ_RECEIPT_DELAY", "0.25"))
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "180"))
+
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_SHARED_CACHE = os.getenv("AUTH_USER_SHARED_CACHE", "True").lower() in ("true", "1")
+AUTH_USER_LOCAL_CACHE_TTL = float(os.getenv("AUTH_USER_LOCAL_CACHE_TTL", "5"))
+AUTH_USER_LOCAL_CACHE_SIZE = int(os.getenv("AUTH_USER_LOCAL_CACHE_SIZE", "10000"))
+
+TOKEN_BLACKLIST_BLOOM_CAPACITY = int(os.getenv("TOKEN_BLACKLIST_BLOOM_CAPACITY", "100000"))
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = float(os.getenv("TOKEN_BLACKLIST_BLOOM_ERROR_RATE", "0.001"))
+# Other workers accept a just-revoked refresh token for up to TOKEN_BLACKLIST_SYNC_INTERVAL seconds.
+TOKEN_BLACKLIST_SYNC_INTERVAL = float(os.getenv("TOKEN_BLACKLIST_SYNC_INTERVAL", "5"))
+# Each sync re-reads this many ids below the newest one seen, to pick up rows that committed late.
+TOKEN_BLACKLIST_SYNC_LOOKBACK = int(os.getenv("TOKEN_BLACKLIST_SYNC_LOOKBACK", "1000"))
+TOKEN_BLACKLIST_REBUILD_INTERVAL = float(os.getenv("TOKEN_BLACKLIST_REBUILD_INTERVAL", "3600"))
+
 DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1")
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "").split(",")
 
@@ -89,7 +128,7 @@ CORS_ORIGIN_ALLOW_ALL = True
 # REST framework settings for JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'User.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -127,6 +166,13 @@ WSGI_APPLICATION = 'Spa.wsgi.application'
 
 ASGI_APPLICATION = 'Spa.asgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -0,0 +1,63 @@
+import json
+import logging
+from collections import namedtuple
+from django.conf import settings
+from .kafka_producer import InMemoryProducer, get_producer
+
+ConsumerRecord = namedtuple('ConsumerRecord', ['topic', 'partition', 'offset', 'key', 'value'])
+
+logger = logging.getLogger(__name__)
+
+def deserialize_value(value):
+    if value is None:
+        return None
+    try:
+        return json.loads(value.decode('utf-8'))
+    except ValueError:
+        logger.warning("Skipping undecodable Kafka record %r", value[:200])
+        return None
+
+def deserialize_key(key):
+    return key.decode('utf-8') if key is not None else None
+
+class InMemoryConsumer:
+    def __init__(self, producer, topic, group_id):
+        self.producer = producer
+        self.topic = topic
+        self.group_id = group_id
+        self.position = producer.committed.get((group_id, topic), 0)
+
+    def poll(self, timeout_ms=0, max_records=None):
+        with self.producer.lock:
+            messages = self.producer.topics[self.topic]
+            end = len(messages) if max_records is None else min(len(messages), self.position + max_records)
+            batch = [
+                ConsumerRecord(self.topic, 0, offset, deserialize_key(key), deserialize_value(value))
+                for offset, (key, value) in enumerate(messages[self.position:end], start=self.position)
+            ]
+        self.position = end
+        return {(self.topic, 0): batch} if batch else {}
+
+    def commit(self):
+        self.producer.committed[(self.group_id, self.topic)] = self.position
+
+    def close(self, autocommit=False):
+        pass
+
+def build_consumer(topic, group_id, max_poll_records=500):
+    if settings.KAFKA_BACKEND == 'memory':
+        producer = get_producer()
+        if not isinstance(producer, InMemoryProducer):
+            raise RuntimeError("KAFKA_BACKEND is 'memory' but the active producer is not in-memory")
+        return InMemoryConsumer(producer, topic, group_id)
+    from kafka import KafkaConsumer
+    return KafkaConsumer(
+        topic,
+        bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+        group_id=group_id,
+        enable_auto_commit=False,
+        auto_offset_reset='earliest',
+        max_poll_records=max_poll_records,
+        key_deserializer=deserialize_key,
+        value_deserializer=deserialize_value,
+    )
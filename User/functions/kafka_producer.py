@@ -0,0 +1,120 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+def serialize_value(value):
+    return json.dumps(value, cls=DjangoJSONEncoder).encode('utf-8')
+
+def serialize_key(key):
+    return str(key).encode('utf-8') if key is not None else None
+
+class InMemoryFuture:
+    def __init__(self, offset):
+        self.offset = offset
+        self.exception = None
+
+    def add_callback(self, fn, *args, **kwargs):
+        fn(*args, self, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        return self
+
+    def succeeded(self):
+        return True
+
+    def failed(self):
+        return False
+
+    def get(self, timeout=None):
+        return self
+
+class InMemoryProducer:
+    def __init__(self):
+        self.topics = defaultdict(list)
+        self.committed = {}
+        self.lock = threading.Lock()
+
+    def send(self, topic, value=None, key=None):
+        with self.lock:
+            messages = self.topics[topic]
+            messages.append((serialize_key(key), serialize_value(value)))
+            return InMemoryFuture(len(messages) - 1)
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+def build_producer():
+    if settings.KAFKA_BACKEND == 'memory':
+        return InMemoryProducer()
+    from kafka import KafkaProducer
+    return KafkaProducer(
+        bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+        value_serializer=serialize_value,
+        key_serializer=serialize_key,
+        acks='all',
+        retries=5,
+        linger_ms=settings.KAFKA_LINGER_MS,
+        batch_size=settings.KAFKA_BATCH_SIZE,
+        compression_type=settings.KAFKA_COMPRESSION_TYPE,
+        max_block_ms=settings.KAFKA_MAX_BLOCK_MS,
+    )
+
+_producer = None
+_producer_pid = None
+_lock = threading.Lock()
+
+def get_producer():
+    global _producer, _producer_pid
+    if _producer is not None and _producer_pid == os.getpid():
+        return _producer
+    with _lock:
+        if _producer is None or _producer_pid != os.getpid():
+            _producer = build_producer()
+            _producer_pid = os.getpid()
+        return _producer
+
+def set_producer(producer):
+    global _producer, _producer_pid
+    with _lock:
+        _producer = producer
+        _producer_pid = os.getpid() if producer is not None else None
+
+def close_producer(timeout=5):
+    global _producer, _producer_pid
+    with _lock:
+        producer, _producer, _producer_pid = _producer, None, None
+    if producer is not None:
+        try:
+            producer.flush(timeout=timeout)
+            producer.close(timeout=timeout)
+        except Exception:
+            logger.exception("Failed to close Kafka producer")
+
+atexit.register(close_producer)
+
+def on_delivered(topic, key, metadata):
+    logger.debug("Delivered %s message %s at offset %s", topic, key, metadata.offset)
+
+def on_failed(topic, key, exc):
+    logger.error("Failed to deliver %s message %s: %s", topic, key, exc)
+
+def publish(topic, value, key=None):
+    try:
+        future = get_producer().send(topic, value=value, key=key)
+    except Exception:
+        logger.exception("Failed to enqueue %s message %s", topic, key)
+        return None
+    future.add_callback(on_delivered, topic, key)
+    future.add_errback(on_failed, topic, key)
+    return future
@@ -2,38 +2,78 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import ssl
 import smtplib
+import socket
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
 from django.conf import settings
+from User.models import QueuedEmail
 
 class EmailProvider:
-    def __init__(self, host, port, username, password, use_ssl=True):
+    def __init__(self, host, port, username, password, use_ssl=True, timeout=None):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.server = None
 
-    def send_email(self, sender, recipient, subject, html_content):
+    def build_message(self, sender, recipient, subject, html_content):
         message = MIMEMultipart()
         message['From'] = sender
         message['To'] = recipient
         message['Subject'] = subject
         message.attach(MIMEText(html_content, "html"))
-        email_string = message.as_string()
+        return message.as_string()
 
+    def open(self):
+        if self.server is not None:
+            return self.server
+        timeout = self.timeout or socket.getdefaulttimeout()
         if self.use_ssl:
             context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(self.host, self.port, context=context) as server:
-                server.login(self.username, self.password)
-                server.sendmail(sender, recipient, email_string)
+            server = smtplib.SMTP_SSL(self.host, self.port, context=context, timeout=timeout)
         else:
-            with smtplib.SMTP(self.host, self.port) as server:
-                server.starttls()
-                server.login(self.username, self.password)
-                server.sendmail(sender, recipient, email_string)
+            server = smtplib.SMTP(self.host, self.port, timeout=timeout)
+            server.starttls()
+        try:
+            server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        return server
 
-        return {"success": True}
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def send(self, sender, recipient, subject, html_content):
+        email_string = self.build_message(sender, recipient, subject, html_content)
+        try:
+            self.open().sendmail(sender, recipient, email_string)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.open().sendmail(sender, recipient, email_string)
+
+    def send_many(self, emails):
+        errors = []
+        for email in emails:
+            try:
+                self.send(**email)
+                errors.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                errors.append(e)
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    self.close()
+        return errors
 
 
 def get_email_provider():
@@ -42,58 +82,92 @@ def get_email_provider():
         port=settings.EMAIL_PORT,
         username=settings.EMAIL_SENDER,
         password=settings.EMAIL_PASSWORD,
-        use_ssl=getattr(settings, 'EMAIL_USE_SSL', True)
+        use_ssl=getattr(settings, 'EMAIL_USE_SSL', True),
+        timeout=settings.EMAIL_TIMEOUT
     )
 
 
+def enqueue_email(sender, recipient, subject, html_content):
+    email = QueuedEmail.objects.create(sender=sender, recipient=recipient, subject=subject, html_content=html_content)
+    return {"success": True, "queued": email.id}
+
+
+def enqueue_emails(sender, subject, messages, batch_size=500):
+    emails = QueuedEmail.objects.bulk_create(
+        [QueuedEmail(sender=sender, recipient=recipient, subject=subject, html_content=html_content) for recipient, html_content in messages],
+        batch_size=batch_size
+    )
+    return {"success": True, "queued": len(emails)}
+
+
+EMAIL_TEMPLATES = {
+    "registration": {
+        "template": "registration.html",
+        "subject": "RoomSpa Account Registration"
+    },
+    "password_reset": {
+        "template": "password_reset.html",
+        "subject": "RoomSpa Password Reset"
+    },
+    "email_update": {
+        "template": "email_update.html",
+        "subject": "RoomSpa Confirm Your New Email Address"
+    }
+}
+
+PLACEHOLDER = re.compile(r"\{\{ (\w+) \}\}")
+
+
+class CompiledTemplate:
+    def __init__(self, source):
+        self.literals = []
+        self.keys = []
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            self.literals.append(source[position:match.start()])
+            self.keys.append(match.group(1))
+            position = match.end()
+        self.literals.append(source[position:])
+
+    def render(self, context):
+        parts = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            parts.append(str(context[key]) if key in context else f"{{{{ {key} }}}}")
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=None)
 def load_template(template_name):
     current_dir = Path(__file__).parent
     template_path = current_dir / 'emails' / template_name
     
     with open(template_path, 'r') as file:
-        return file.read()
+        return CompiledTemplate(file.read())
 
 
-def render_template(template_content, context):
-    for key, value in context.items():
-        template_content = template_content.replace(f"{{{{ {key} }}}}", str(value))
-    return template_content
+def send_registration_link(username, email_receiver, registration_link, email_type):
+    return send_bulk_email(email_type, [(email_receiver, {"username": username, "registration_link": registration_link})])
 
 
-def send_registration_link(username, email_receiver, registration_link, email_type):
-    template_map = {
-        "registration": {
-            "template": "registration.html",
-            "subject": "RoomSpa Account Registration"
-        },
-        "password_reset": {
-            "template": "password_reset.html",
-            "subject": "RoomSpa Password Reset"
-        },
-        "email_update": {
-            "template": "email_update.html",
-            "subject": "RoomSpa Confirm Your New Email Address"
-        }
-    }
-    
-    if email_type not in template_map:
+def send_bulk_email(email_type, recipients):
+    if email_type not in EMAIL_TEMPLATES:
         return {"success": False, "error": f"Unknown email type: {email_type}"}
     
-    template_data = template_map[email_type]
-    
-    context = {
-        "username": username,
-        "registration_link": registration_link
-    }
-    
-    template_content = load_template(template_data["template"])
-    html_content = render_template(template_content, context)
+    template_data = EMAIL_TEMPLATES[email_type]
+    template = load_template(template_data["template"])
     subject = template_data["subject"]
+    messages = [(recipient, template.render(context)) for recipient, context in recipients]
     
+    if settings.EMAIL_QUEUE:
+        if len(messages) == 1:
+            return enqueue_email(settings.EMAIL_SENDER, messages[0][0], subject, messages[0][1])
+        return enqueue_emails(settings.EMAIL_SENDER, subject, messages)
+
     email_provider = get_email_provider()
-    return email_provider.send_email(
-        sender=settings.EMAIL_SENDER,
-        recipient=email_receiver,
-        subject=subject,
-        html_content=html_content
-    )
\ No newline at end of file
+    try:
+        for recipient, html_content in messages:
+            email_provider.send(settings.EMAIL_SENDER, recipient, subject, html_content)
+    finally:
+        email_provider.close()
+    return {"success": True}
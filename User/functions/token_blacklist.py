@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        if value in self:
+            return
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+class BlacklistFilter:
+    def __init__(self, capacity, error_rate, sync_interval, sync_lookback, rebuild_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.sync_lookback = sync_lookback
+        self.rebuild_interval = rebuild_interval
+        self.bloom = None
+        self.last_id = 0
+        self.synced_at = 0
+        self.rebuilt_at = 0
+        self.rebuilding = None
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        try:
+            rows = list(BlacklistedToken.objects.order_by('id').values_list('id', 'token__jti'))
+            capacity = self.capacity
+            while capacity < len(rows) * 2:
+                capacity *= 2
+            bloom = BloomFilter(capacity, self.error_rate)
+            for _, jti in rows:
+                bloom.add(jti)
+            with self.lock:
+                for jti in self.rebuilding or ():
+                    bloom.add(jti)
+                self.bloom = bloom
+                self.last_id = rows[-1][0] if rows else 0
+                self.synced_at = self.rebuilt_at = time.monotonic()
+        except Exception:
+            logger.exception("Failed to rebuild the token blacklist filter")
+        finally:
+            with self.lock:
+                self.rebuilding = None
+
+    def start_rebuild(self):
+        if self.rebuilding is None:
+            self.rebuilding = []
+            threading.Thread(target=self.rebuild_in_background, daemon=True).start()
+
+    def rebuild_in_background(self):
+        try:
+            self.rebuild()
+        finally:
+            connection.close()
+
+    def sync(self):
+        rows = list(
+            BlacklistedToken.objects.filter(id__gt=max(self.last_id - self.sync_lookback, 0))
+            .order_by('id')
+            .values_list('id', 'token__jti')
+        )
+        for _, jti in rows:
+            self.bloom.add(jti)
+        if rows:
+            self.last_id = max(self.last_id, rows[-1][0])
+        self.synced_at = time.monotonic()
+        if self.bloom.count > self.bloom.capacity:
+            self.start_rebuild()
+
+    def might_contain(self, jti):
+        with self.lock:
+            if self.bloom is None:
+                self.start_rebuild()
+                return True
+            now = time.monotonic()
+            if now - self.rebuilt_at >= self.rebuild_interval:
+                self.start_rebuild()
+            if now - self.synced_at >= self.sync_interval:
+                self.sync()
+            return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+            if self.rebuilding is not None:
+                self.rebuilding.append(jti)
+
+blacklist_filter = BlacklistFilter(
+    settings.TOKEN_BLACKLIST_BLOOM_CAPACITY,
+    settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE,
+    settings.TOKEN_BLACKLIST_SYNC_INTERVAL,
+    settings.TOKEN_BLACKLIST_SYNC_LOOKBACK,
+    settings.TOKEN_BLACKLIST_REBUILD_INTERVAL,
+)
+
+class FilteredRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
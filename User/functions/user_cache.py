@@ -0,0 +1,96 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+class LocalUserCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[0]
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.entries[user_id] = (user, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+local_users = LocalUserCache(settings.AUTH_USER_LOCAL_CACHE_SIZE, settings.AUTH_USER_LOCAL_CACHE_TTL)
+
+SECRET_FIELDS = {'password', 'verification_token'}
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+def shared_get(user_id):
+    try:
+        values = cache.get(user_cache_key(user_id))
+    except Exception:
+        logger.warning("Shared user cache unavailable, falling back to the database", exc_info=True)
+        return None
+    if values is None:
+        return None
+    model = get_user_model()
+    fields = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db('default', fields, [values[name] for name in fields])
+
+def shared_set(user_id, user):
+    values = {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields if field.attname not in SECRET_FIELDS}
+    try:
+        cache.set(user_cache_key(user_id), values, settings.AUTH_USER_CACHE_TTL)
+    except Exception:
+        logger.warning("Failed to write user %s to the shared cache", user_id, exc_info=True)
+
+def shared_delete(user_id):
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception:
+        logger.warning("Failed to invalidate user %s in the shared cache", user_id, exc_info=True)
+
+def get_cached_user(user_id):
+    user_id = str(user_id)
+    user = local_users.get(user_id)
+    if user is None and settings.AUTH_USER_SHARED_CACHE:
+        user = shared_get(user_id)
+        if user is not None:
+            local_users.set(user_id, user)
+    if user is None:
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        local_users.set(user_id, user)
+        if settings.AUTH_USER_SHARED_CACHE:
+            shared_set(user_id, user)
+    return copy.copy(user)
+
+def invalidate_cached_user(user_id):
+    local_users.delete(str(user_id))
+    if settings.AUTH_USER_SHARED_CACHE:
+        shared_delete(user_id)
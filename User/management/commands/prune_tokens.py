@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+class Command(BaseCommand):
+    help = 'Deletes expired JWT outstanding tokens and their blacklist entries in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches.')
+        parser.add_argument('--grace-hours', type=int, default=0, help='Keep tokens until this long after they expire.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        started = time.monotonic()
+        last_id = 0
+        outstanding = blacklisted = 0
+        while True:
+            ids = list(
+                OutstandingToken.objects.filter(id__gt=last_id, expires_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Deleted {outstanding} outstanding and {blacklisted} blacklisted tokens ({outstanding / elapsed:.0f}/s)...')
+            if len(ids) < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {outstanding} outstanding and {blacklisted} blacklisted tokens expired before {cutoff:%Y-%m-%d %H:%M} in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,76 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from User.models import QueuedEmail
+from User.functions.send_mail import get_email_provider
+
+class Command(BaseCommand):
+    help = 'Sends queued emails over a persistent SMTP connection, retrying failures with exponential backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--backoff', type=float, default=30.0, help='Base retry delay in seconds, doubled per attempt.')
+        parser.add_argument('--max-backoff', type=float, default=3600.0)
+        parser.add_argument('--lease', type=float, default=300.0, help='Seconds a claimed email stays hidden from other workers while it is being sent.')
+        parser.add_argument('--idle-close', type=float, default=60.0, help='Close the SMTP connection after this many idle seconds.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+
+    def handle(self, *args, **options):
+        provider = get_email_provider()
+        idle_since = time.monotonic()
+        try:
+            while True:
+                if self.send_batch(provider, options):
+                    idle_since = time.monotonic()
+                    continue
+                if options['once']:
+                    break
+                if provider.server is not None and time.monotonic() - idle_since >= options['idle_close']:
+                    provider.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            provider.close()
+
+    def claim_batch(self, options):
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(
+                QueuedEmail.objects.select_for_update(skip_locked=True)
+                .filter(sent_at__isnull=True, failed_at__isnull=True, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:options['batch_size']]
+            )
+            if emails:
+                QueuedEmail.objects.filter(id__in=[email.id for email in emails]).update(next_attempt_at=now + timedelta(seconds=options['lease']))
+        return emails
+
+    def send_batch(self, provider, options):
+        emails = self.claim_batch(options)
+        if not emails:
+            return 0
+        errors = provider.send_many([
+            {'sender': email.sender, 'recipient': email.recipient, 'subject': email.subject, 'html_content': email.html_content}
+            for email in emails
+        ])
+        now = timezone.now()
+        sent = [email.id for email, error in zip(emails, errors) if error is None]
+        if sent:
+            QueuedEmail.objects.filter(id__in=sent).update(sent_at=now, html_content='')
+        failed = [(email, error) for email, error in zip(emails, errors) if error is not None]
+        for email, error in failed:
+            email.attempts += 1
+            email.last_error = str(error)
+            if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                email.failed_at = now
+                email.html_content = ''
+            else:
+                delay = min(options['backoff'] * 2 ** (email.attempts - 1), options['max_backoff'])
+                email.next_attempt_at = now + timedelta(seconds=delay)
+        QueuedEmail.objects.bulk_update([email for email, _ in failed], ['attempts', 'last_error', 'failed_at', 'next_attempt_at', 'html_content'])
+        self.stdout.write(f'Sent {len(sent)} emails, {len(failed)} failed.')
+        return len(sent)
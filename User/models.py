@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.validators import RegexValidator
@@ -85,4 +86,22 @@ class UserProfile(AbstractBaseUser, PermissionsMixin):
     def save(self, *args, **kwargs):
         if not self.email and not self.phone_number:
             raise ValueError("Either email or phone number must be provided")
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class QueuedEmail(models.Model):
+    sender = models.CharField(max_length=255)
+    recipient = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    html_content = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='email_queue_pending_idx', condition=Q(sent_at__isnull=True, failed_at__isnull=True)),
+        ]
+        ordering = ['id']
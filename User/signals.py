@@ -0,0 +1,10 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import UserProfile
+from .functions.user_cache import invalidate_cached_user
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def user_profile_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
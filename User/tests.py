@@ -1,3 +1,234 @@
-from django.test import TestCase
+import datetime
+import io
+import socket
+import ssl
+import tempfile
+import uuid
+from pathlib import Path
+from unittest import mock
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from .models import QueuedEmail
+from .functions.send_mail import EmailProvider, send_registration_link
+from .functions.token_blacklist import BlacklistFilter
+from .functions.user_cache import get_cached_user, local_users, user_cache_key
 
-# Create your tests here.
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def tls_context(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = Path(directory) / 'cert.pem', Path(directory) / 'key.pem'
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+class RecordingHandler:
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.messages = []
+        self.logins = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return '550 mailbox unavailable'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content.decode()))
+        return '250 OK'
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=auth_data.login == b'mailer' and auth_data.password == b'secret')
+
+class SMTPServerMixin:
+    refused = ()
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.handler = RecordingHandler(self.refused)
+        self.port = free_port()
+        self.controller = Controller(
+            self.handler,
+            hostname='127.0.0.1',
+            port=self.port,
+            tls_context=tls_context(self.tempdir.name),
+            require_starttls=True,
+            auth_required=True,
+            authenticator=self.handler.authenticate,
+        )
+        self.controller.start()
+
+    def tearDown(self):
+        self.controller.stop()
+        self.tempdir.cleanup()
+        super().tearDown()
+
+    def provider(self):
+        return EmailProvider('127.0.0.1', self.port, 'mailer', 'secret', use_ssl=False, timeout=5)
+
+    def email(self, recipient):
+        return {'sender': 'noreply@roomspa.test', 'recipient': recipient, 'subject': 'Hello', 'html_content': '<p>Hi</p>'}
+
+class EmailProviderTests(SMTPServerMixin, SimpleTestCase):
+    refused = ('bounce@roomspa.test',)
+
+    def test_send_many_reuses_one_authenticated_connection(self):
+        provider = self.provider()
+        errors = provider.send_many([self.email(f'user{i}@roomspa.test') for i in range(3)])
+        provider.close()
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(self.handler.logins, 1)
+        self.assertEqual([rcpt for _, rcpt, _ in self.handler.messages], [[f'user{i}@roomspa.test'] for i in range(3)])
+
+    def test_refused_recipient_keeps_connection_for_the_rest(self):
+        provider = self.provider()
+        errors = provider.send_many([self.email('bounce@roomspa.test'), self.email('ok@roomspa.test')])
+        provider.close()
+        self.assertIsNotNone(errors[0])
+        self.assertIsNone(errors[1])
+        self.assertEqual(self.handler.logins, 1)
+        self.assertEqual(len(self.handler.messages), 1)
+
+class SendQueuedEmailsTests(SMTPServerMixin, TestCase):
+    refused = ('bounce@roomspa.test',)
+
+    def run_worker(self):
+        with override_settings(EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.port, EMAIL_SENDER='mailer', EMAIL_PASSWORD='secret', EMAIL_USE_SSL=False):
+            call_command('send_queued_emails', '--once', stdout=io.StringIO())
+
+    @override_settings(EMAIL_QUEUE=True, EMAIL_SENDER='mailer')
+    def test_registration_link_is_queued_not_sent(self):
+        send_registration_link('Ann', 'ann@roomspa.test', '123456', 'registration')
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.recipient, 'ann@roomspa.test')
+        self.assertIn('Ann', email.html_content)
+        self.assertEqual(self.handler.messages, [])
+
+    def test_worker_sends_and_clears_content(self):
+        email = QueuedEmail.objects.create(sender='mailer', recipient='ann@roomspa.test', subject='Hello', html_content='<p>OTP 123456</p>')
+        self.run_worker()
+        email.refresh_from_db()
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(email.html_content, '')
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertIn('OTP 123456', self.handler.messages[0][2])
+
+    def test_worker_backs_off_failed_emails(self):
+        email = QueuedEmail.objects.create(sender='mailer', recipient='bounce@roomspa.test', subject='Hello', html_content='<p>Hi</p>')
+        self.run_worker()
+        email.refresh_from_db()
+        self.assertIsNone(email.sent_at)
+        self.assertIsNone(email.failed_at)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('550', email.last_error)
+
+    @override_settings(EMAIL_MAX_ATTEMPTS=1)
+    def test_worker_gives_up_after_max_attempts(self):
+        email = QueuedEmail.objects.create(sender='mailer', recipient='bounce@roomspa.test', subject='Hello', html_content='<p>Hi</p>')
+        self.run_worker()
+        email.refresh_from_db()
+        self.assertIsNotNone(email.failed_at)
+        self.assertEqual(email.html_content, '')
+
+class BlacklistFilterTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('Ann', email='ann@roomspa.test', password='secret', role='customer')
+
+    def blacklist(self):
+        jti = uuid.uuid4().hex
+        token = OutstandingToken.objects.create(user=self.user, jti=jti, token=jti, expires_at=timezone.now() + datetime.timedelta(days=1))
+        return jti, BlacklistedToken.objects.create(token=token)
+
+    def blacklist_filter(self, lookback=10):
+        return BlacklistFilter(100, 1e-6, sync_interval=0, sync_lookback=lookback, rebuild_interval=3600)
+
+    def test_first_use_falls_back_to_the_database(self):
+        blacklist_filter = self.blacklist_filter()
+        with mock.patch.object(blacklist_filter, 'start_rebuild') as start_rebuild:
+            self.assertTrue(blacklist_filter.might_contain('unknown'))
+        start_rebuild.assert_called_once()
+
+    def test_rebuild_and_sync_pick_up_new_tokens(self):
+        revoked, _ = self.blacklist()
+        blacklist_filter = self.blacklist_filter()
+        blacklist_filter.rebuild()
+        self.assertTrue(blacklist_filter.might_contain(revoked))
+        self.assertFalse(blacklist_filter.might_contain(uuid.uuid4().hex))
+        later, _ = self.blacklist()
+        self.assertTrue(blacklist_filter.might_contain(later))
+
+    def test_sync_looks_back_for_late_commits(self):
+        blacklist_filter = self.blacklist_filter(lookback=10)
+        blacklist_filter.rebuild()
+        late, row = self.blacklist()
+        blacklist_filter.last_id = row.id + 5
+        self.assertTrue(blacklist_filter.might_contain(late))
+        missed, row = self.blacklist()
+        blacklist_filter.last_id = row.id + 50
+        self.assertFalse(blacklist_filter.might_contain(missed))
+
+@override_settings(AUTH_USER_SHARED_CACHE=True, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('Ann', email='ann@roomspa.test', password='secret', role='customer')
+        local_users.clear()
+        self.addCleanup(local_users.clear)
+
+    def test_shared_cache_omits_secrets(self):
+        get_cached_user(self.user.pk)
+        values = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', values)
+        self.assertNotIn('verification_token', values)
+        local_users.clear()
+        with self.assertNumQueries(0):
+            user = get_cached_user(self.user.pk)
+        self.assertEqual((user.pk, user.role), (self.user.pk, 'customer'))
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertTrue(user.check_password('secret'))
+
+    def test_saving_a_shared_cache_user_keeps_the_password(self):
+        get_cached_user(self.user.pk)
+        local_users.clear()
+        user = get_cached_user(self.user.pk)
+        user.name = 'Anna'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Anna')
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_shared_cache_errors_fall_back_to_the_database(self):
+        broken = mock.Mock(**{'get.side_effect': ConnectionError, 'set.side_effect': ConnectionError})
+        with mock.patch('User.functions.user_cache.cache', broken), self.assertLogs('User.functions.user_cache', 'WARNING'):
+            user = get_cached_user(self.user.pk)
+        self.assertEqual(user.pk, self.user.pk)
@@ -11,6 +11,7 @@ from .functions.generate_verification import generate_verification_token
 from .functions.generate_otp import generate_verification_otp
 from .functions.send_mail import send_registration_link
 from .functions.encryption import encrypt_password, decrypt_password
+from .functions.token_blacklist import FilteredRefreshToken
 
 @api_view(['POST'])
 def login(request):
@@ -59,7 +60,7 @@ def get_user_profile(request):
 def logout(request):
     try:
         refresh_token = request.data.get('refresh_token')
-        token = RefreshToken(refresh_token)
+        token = FilteredRefreshToken(refresh_token)
         token.blacklist()  
         return Response({
             'message': 'Logout successful'
@@ -328,7 +329,7 @@ def refresh_token(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        token = RefreshToken(refresh_token)
+        token = FilteredRefreshToken(refresh_token)
         new_access_token = str(token.access_token)
         
         return Response({
@@ -0,0 +1,49 @@
+# Run from the project root: python -m benchmarks.chat_codecs
+import json
+import random
+import string
+import timeit
+from chat.functions.codecs import JSON, CODECS
+
+FANOUTS = [1, 10, 100]
+MESSAGES = 1_000
+
+def make_frames(n, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            'conversation_id': rng.randint(1, 100_000),
+            'message': ''.join(rng.choice(string.ascii_letters + ' ') for _ in range(rng.randint(5, 200))),
+            'sender_id': rng.randint(1, 100_000),
+            'username': rng.choice(['Aisha Khan', 'Omar', 'Priya Sharma', 'Lee']),
+            'message_id': str(rng.randint(1, 10_000_000)),
+        }
+        for _ in range(n)
+    ]
+
+def legacy_encode(frame):
+    return {'text_data': json.dumps(frame)}
+
+def frame_size(encoded):
+    data = encoded.get('text_data')
+    return len(data.encode()) if data is not None else len(encoded['bytes_data'])
+
+def fan_out(encode, frames, receivers):
+    for frame in frames:
+        for _ in range(receivers):
+            encode(frame)
+
+def main():
+    frames = make_frames(MESSAGES)
+    codecs = [('json (legacy)', legacy_encode), ('json', JSON.encode), ('msgpack', CODECS['msgpack'].encode)]
+    print(f"{'codec':>14} {'bytes/msg':>10}" + ''.join(f" {f'fanout {n} us':>15}" for n in FANOUTS))
+    for name, encode in codecs:
+        size = sum(frame_size(encode(frame)) for frame in frames) / len(frames)
+        timings = []
+        for receivers in FANOUTS:
+            seconds = min(timeit.repeat(lambda: fan_out(encode, frames, receivers), number=1, repeat=3))
+            timings.append(seconds / len(frames) * 1_000_000)
+        print(f"{name:>14} {size:>10.1f}" + ''.join(f" {t:>15.1f}" for t in timings))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# Run from the project root: python -m benchmarks.geo_distance
+import random
+import timeit
+import numpy as np
+from therapist.functions.geo import haversine, within_radius
+
+SIZES = [1_000, 10_000, 100_000]
+CENTER = (25.2048, 55.2708)
+SEARCH_RADIUS = 10.0
+
+def make_therapists(n, seed=42):
+    rng = random.Random(seed)
+    return [
+        (CENTER[0] + rng.uniform(-0.5, 0.5), CENTER[1] + rng.uniform(-0.5, 0.5), rng.uniform(2, 30))
+        for _ in range(n)
+    ]
+
+def loop_search(rows):
+    hits = []
+    for i, (lat, lon, service_radius) in enumerate(rows):
+        distance = haversine(CENTER[0], CENTER[1], lat, lon)
+        if distance <= SEARCH_RADIUS and distance <= service_radius:
+            hits.append(i)
+    return hits
+
+def vectorized_search(coords):
+    mask, _ = within_radius(CENTER[0], CENTER[1], coords[:, 0], coords[:, 1], SEARCH_RADIUS, coords[:, 2])
+    return np.flatnonzero(mask)
+
+def main():
+    print(f"{'therapists':>10} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n in SIZES:
+        rows = make_therapists(n)
+        coords = np.array(rows, dtype=np.float64)
+        assert loop_search(rows) == vectorized_search(coords).tolist()
+        repeat = max(1, 100_000 // n)
+        loop_ms = min(timeit.repeat(lambda: loop_search(rows), number=repeat, repeat=3)) / repeat * 1000
+        numpy_ms = min(timeit.repeat(lambda: vectorized_search(coords), number=repeat, repeat=3)) / repeat * 1000
+        print(f"{n:>10} {loop_ms:>10.2f} {numpy_ms:>10.2f} {loop_ms / numpy_ms:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,123 @@
-import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
 from chat.models import Conversation, Message
+from chat.functions.message_buffer import get_message_buffer, persist_batch
+from chat.functions.read_state import ensure_read_states, mark_messages_read
+from chat.functions.codecs import compact, negotiate
+from chat.functions.ids import parse_id
 
 User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def room_group(customer_id, therapist_id):
+    return f'chat_{customer_id}_{therapist_id}'
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+def other_participant(conversation, user_id):
+    return conversation.therapist_id if user_id == conversation.customer_id else conversation.customer_id
+
+async def send_read_receipt(channel_layer, conversation, reader_id, last_read_id):
+    event = {
+        'type': 'read_receipt',
+        'conversation_id': conversation.id,
+        'reader_id': reader_id,
+        'last_read_message_id': last_read_id,
+    }
+    await channel_layer.group_send(room_group(conversation.customer_id, conversation.therapist_id), event)
+    other_id = other_participant(conversation, reader_id)
+    if other_id is not None:
+        await channel_layer.group_send(user_group(other_id), event)
+
+class MessagingMixin:
+    async def deliver(self, conversation, message):
+        user = self.scope['user']
+        receiver_id = other_participant(conversation, user.id)
+        if settings.CHAT_WRITE_BEHIND:
+            await get_message_buffer().add(conversation.id, user.id, receiver_id, message)
+            message_id = None
+        else:
+            msg_obj = await self.create_message(conversation.id, user.id, receiver_id, message)
+            message_id = str(msg_obj.id)
+        await self.channel_layer.group_send(
+            room_group(conversation.customer_id, conversation.therapist_id),
+            {
+                'type': 'chat_message',
+                'message': message,
+                'username': user.name,
+            }
+        )
+        event = compact({
+            'type': 'inbox_message',
+            'conversation_id': conversation.id,
+            'message': message,
+            'sender_id': user.id,
+            'username': user.name,
+            'message_id': message_id,
+        })
+        for member_id in (conversation.customer_id, conversation.therapist_id):
+            await self.channel_layer.group_send(user_group(member_id), event)
+
+    def negotiate_codec(self):
+        self.codec = negotiate(self.scope.get('subprotocols'))
+        return self.codec.subprotocol or self.scope.get('auth_subprotocol')
+
+    async def send_frame(self, frame):
+        await self.send(**self.codec.encode(frame))
+
+    async def queue_read(self, conversation, message_id):
+        try:
+            up_to_id = None if message_id in (None, '') else int(message_id)
+        except (TypeError, ValueError):
+            return
+        if conversation.id in self.pending_reads:
+            previous = self.pending_reads[conversation.id][1]
+            up_to_id = None if previous is None or up_to_id is None else max(previous, up_to_id)
+        self.pending_reads[conversation.id] = (conversation, up_to_id)
+        if self.read_task is None or self.read_task.done():
+            self.read_task = asyncio.get_running_loop().create_task(self.flush_reads(settings.CHAT_READ_RECEIPT_DELAY))
+
+    async def flush_reads(self, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+        pending, self.pending_reads = self.pending_reads, {}
+        user_id = self.scope['user'].id
+        if pending and settings.CHAT_WRITE_BEHIND:
+            await get_message_buffer().flush()
+        for conversation, up_to_id in pending.values():
+            marked, last_read_id = await database_sync_to_async(mark_messages_read)(conversation.id, user_id, up_to_id)
+            if marked:
+                await send_read_receipt(self.channel_layer, conversation, user_id, last_read_id)
+
+    async def read_receipt(self, event):
+        if event['reader_id'] == self.scope['user'].id:
+            return
+        await self.send_frame({
+            'type': 'read_receipt',
+            'conversation_id': event['conversation_id'],
+            'reader_id': event['reader_id'],
+            'last_read_message_id': event['last_read_message_id'],
+        })
+
+    @database_sync_to_async
+    def get_or_create_conversation(self, customer_id, therapist_id):
+        with transaction.atomic():
+            conversation, created = Conversation.objects.get_or_create(customer_id=customer_id, therapist_id=therapist_id)
+            if created:
+                conversation.participants.add(customer_id, therapist_id)
+                ensure_read_states(conversation.id, [customer_id, therapist_id])
+        return conversation
+
+    @database_sync_to_async
+    def create_message(self, conversation_id, sender_id, receiver_id, content):
+        return persist_batch([Message(conversation_id=conversation_id, sender_id=sender_id, receiver_id=receiver_id, content=content)])[0]
+
+class ChatConsumer(MessagingMixin, AsyncWebsocketConsumer):
     async def connect(self):
         user = self.scope['user']
         self.customer_id = self.scope['url_route']['kwargs']['customer_id']
@@ -23,49 +134,103 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if user.role not in ['customer', 'therapist']:
             await self.close()
             return
-        self.room_group_name = f'chat_{self.customer_id}_{self.therapist_id}'
-        self.conversation = await self.get_or_create_conversation(self.customer_id, self.therapist_id)
+        self.room_group_name = room_group(self.customer_id, self.therapist_id)
+        self.conversation = await self.get_or_create_conversation(int(self.customer_id), int(self.therapist_id))
+        self.pending_reads = {}
+        self.read_task = None
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-    
+        await self.accept(subprotocol=self.negotiate_codec())
+
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-    
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        message = data.get('message', '')
-        username = self.scope['user'].username
-        sender_id = self.scope['user'].id
-        receiver_id = self.therapist_id if self.scope['user'].role == 'customer' else self.customer_id
-        msg_obj = await self.create_message(self.conversation, sender_id, receiver_id, message)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'message_id': str(msg_obj.id),
-            }
-        )
-    
+        if settings.CHAT_WRITE_BEHIND:
+            await get_message_buffer().flush()
+        await self.flush_reads()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.codec.decode(text_data, bytes_data)
+        if data.get('action') == 'mark_read':
+            await self.queue_read(self.conversation, data.get('message_id'))
+            return
+        await self.deliver(self.conversation, data.get('message', ''))
+
     async def chat_message(self, event):
         message = event['message']
         username = event.get('username', 'Anonymous')
-        await self.send(text_data=json.dumps({'message': message, 'username': username}))
-    
-    @database_sync_to_async
-    def get_or_create_conversation(self, customer_id, therapist_id):
-        conversation = Conversation.objects.filter(participants__id=customer_id).filter(participants__id=therapist_id).first()
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(customer_id, therapist_id)
+        await self.send_frame({'message': message, 'username': username})
+
+class InboxConsumer(MessagingMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated or user.role not in ['customer', 'therapist']:
+            await self.close()
+            return
+        self.conversations = {}
+        self.pending_reads = {}
+        self.read_task = None
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=self.negotiate_codec())
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'group_name'):
+            return
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if settings.CHAT_WRITE_BEHIND:
+            await get_message_buffer().flush()
+        await self.flush_reads()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.codec.decode(text_data, bytes_data)
+        conversation = await self.resolve_conversation(data)
+        if conversation is None:
+            await self.send_frame({'error': 'Conversation not found.'})
+            return
+        if data.get('action') == 'mark_read':
+            await self.queue_read(conversation, data.get('message_id'))
+            return
+        await self.deliver(conversation, data.get('message', ''))
+
+    async def resolve_conversation(self, data):
+        if data.get('conversation_id'):
+            conversation_id = parse_id(data['conversation_id'])
+            if conversation_id in self.conversations:
+                return self.conversations[conversation_id]
+            conversation = await self.find_conversation(conversation_id) if conversation_id is not None else None
+        elif data.get('recipient_id'):
+            conversation = await self.start_conversation(data['recipient_id'])
+        else:
+            conversation = None
+        if conversation is not None:
+            self.conversations[conversation.id] = conversation
         return conversation
-    
+
     @database_sync_to_async
-    def create_message(self, conversation, sender_id, receiver_id, content):
-        sender = User.objects.get(id=sender_id)
-        receiver = User.objects.get(id=receiver_id)
-        message_obj = Message.objects.create(conversation=conversation, sender=sender, receiver=receiver, content=content)
-        conversation.last_message = message_obj
-        conversation.save()
-        return message_obj
\ No newline at end of file
+    def find_conversation(self, conversation_id):
+        user_id = self.scope['user'].id
+        return Conversation.objects.filter(Q(customer_id=user_id) | Q(therapist_id=user_id), id=conversation_id).first()
+
+    async def start_conversation(self, recipient_id):
+        user = self.scope['user']
+        other_role = 'therapist' if user.role == 'customer' else 'customer'
+        recipient_id = parse_id(recipient_id)
+        if recipient_id is None or not await self.user_has_role(recipient_id, other_role):
+            return None
+        if user.role == 'customer':
+            return await self.get_or_create_conversation(user.id, recipient_id)
+        return await self.get_or_create_conversation(recipient_id, user.id)
+
+    @database_sync_to_async
+    def user_has_role(self, user_id, role):
+        return User.objects.filter(id=user_id, role=role).exists()
+
+    async def inbox_message(self, event):
+        await self.send_frame({
+            'conversation_id': event['conversation_id'],
+            'message': event['message'],
+            'sender_id': event['sender_id'],
+            'username': event.get('username', 'Anonymous'),
+            'message_id': event.get('message_id'),
+        })
@@ -0,0 +1,36 @@
+import json
+import msgpack
+
+def compact(frame):
+    return {key: value for key, value in frame.items() if value is not None}
+
+json_encoder = json.JSONEncoder(separators=(',', ':'))
+
+class JsonCodec:
+    subprotocol = None
+
+    def encode(self, frame):
+        return {'text_data': json_encoder.encode(frame)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+class MsgpackCodec:
+    subprotocol = 'msgpack'
+
+    def encode(self, frame):
+        return {'bytes_data': msgpack.packb(frame, use_bin_type=True)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            return json.loads(text_data)
+        return msgpack.unpackb(bytes_data, raw=False)
+
+JSON = JsonCodec()
+CODECS = {codec.subprotocol: codec for codec in (MsgpackCodec(),)}
+
+def negotiate(subprotocols):
+    for protocol in subprotocols or []:
+        if protocol.lower() in CODECS:
+            return CODECS[protocol.lower()]
+    return JSON
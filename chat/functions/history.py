@@ -0,0 +1,42 @@
+from django.db.models import Q
+from chat.models import ArchivedMessage, Message
+
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_MAX_PAGE_SIZE = 200
+
+def newer_than(queryset, created_at, message_id):
+    return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id))
+
+def older_than(queryset, created_at, message_id):
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id))
+
+def message_page(queryset, limit, before=None, after=None):
+    if after is not None:
+        page = list(newer_than(queryset, *after).order_by('created_at', 'id')[:limit + 1])
+        return page[:limit], len(page) > limit
+    if before is not None:
+        queryset = older_than(queryset, *before)
+    page = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    return page[:limit][::-1], len(page) > limit
+
+def find_pivot(conversation, message_id):
+    for model in (Message, ArchivedMessage):
+        pivot = model.objects.filter(conversation=conversation, id=message_id).values_list('created_at', 'id').first()
+        if pivot is not None:
+            return pivot
+    return None
+
+def history_page(conversation, limit, before=None, after=None):
+    hot = Message.objects.filter(conversation=conversation).select_related('sender').defer('search_vector')
+    cold = ArchivedMessage.objects.filter(conversation=conversation).select_related('sender').defer('search_vector')
+    if after is not None:
+        page, has_more = message_page(cold, limit, after=after)
+        if not has_more:
+            newer, has_more = message_page(hot, limit - len(page), after=(page[-1].created_at, page[-1].id) if page else after)
+            page += newer
+        return page, has_more
+    page, has_more = message_page(hot, limit, before=before)
+    if not has_more:
+        older, has_more = message_page(cold, limit - len(page), before=(page[0].created_at, page[0].id) if page else before)
+        page = older + page
+    return page, has_more
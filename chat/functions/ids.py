@@ -0,0 +1,5 @@
+def parse_id(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from chat.models import Conversation, Message
+from chat.functions.read_state import record_unread
+
+logger = logging.getLogger(__name__)
+
+def persist_batch(messages):
+    with transaction.atomic():
+        created = Message.objects.bulk_create(messages)
+        latest = {}
+        for message in created:
+            latest[message.conversation_id] = message
+        for conversation_id, message in latest.items():
+            Conversation.objects.filter(pk=conversation_id).update(last_message=message, updated_at=message.created_at)
+        record_unread(created)
+    return created
+
+def persist_messages(messages):
+    try:
+        return persist_batch(messages)
+    except IntegrityError:
+        created = []
+        for message in messages:
+            try:
+                created += persist_batch([message])
+            except IntegrityError:
+                logger.exception("Dropping chat message for conversation %s", message.conversation_id)
+        return created
+
+class MessageBuffer:
+    def __init__(self, interval, max_size, max_pending, max_attempts):
+        self.interval = interval
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.pending = []
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    async def add(self, conversation_id, sender_id, receiver_id, content):
+        self.ensure_running()
+        self.pending.append((0, Message(conversation_id=conversation_id, sender_id=sender_id, receiver_id=receiver_id, content=content)))
+        self.trim()
+        if len(self.pending) >= self.max_size:
+            await self.flush()
+
+    def trim(self):
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            logger.error("Chat write-behind buffer is full, dropping %d oldest messages", overflow)
+            del self.pending[:overflow]
+
+    def ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return []
+            try:
+                return await database_sync_to_async(persist_messages)([message for _, message in batch])
+            except Exception:
+                logger.exception("Failed to persist %d buffered chat messages", len(batch))
+                retry = [(attempts + 1, message) for attempts, message in batch if attempts + 1 < self.max_attempts]
+                if len(retry) < len(batch):
+                    logger.error("Dropping %d chat messages after %d failed attempts", len(batch) - len(retry), self.max_attempts)
+                self.pending = retry + self.pending
+                self.trim()
+                return []
+
+_buffer = None
+
+def get_message_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = MessageBuffer(
+            settings.CHAT_WRITE_BEHIND_INTERVAL,
+            settings.CHAT_WRITE_BEHIND_MAX_BATCH,
+            settings.CHAT_WRITE_BEHIND_MAX_PENDING,
+            settings.CHAT_WRITE_BEHIND_MAX_ATTEMPTS,
+        )
+    return _buffer
@@ -0,0 +1,47 @@
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Coalesce, Greatest
+from chat.models import ConversationReadState, Message
+
+def ensure_read_states(conversation_id, user_ids):
+    ConversationReadState.objects.bulk_create(
+        [ConversationReadState(conversation_id=conversation_id, user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+def increment_unread(conversation_id, user_id, count=1):
+    states = ConversationReadState.objects.filter(conversation_id=conversation_id, user_id=user_id)
+    if states.update(unread_count=F('unread_count') + count):
+        return
+    try:
+        with transaction.atomic():
+            ConversationReadState.objects.create(conversation_id=conversation_id, user_id=user_id, unread_count=count)
+    except IntegrityError:
+        states.update(unread_count=F('unread_count') + count)
+
+def record_unread(messages):
+    for (conversation_id, receiver_id), count in Counter((m.conversation_id, m.receiver_id) for m in messages).items():
+        increment_unread(conversation_id, receiver_id, count)
+
+def mark_messages_read(conversation_id, user_id, up_to_id=None):
+    with transaction.atomic():
+        messages = Message.objects.filter(conversation_id=conversation_id)
+        if up_to_id is not None:
+            messages = messages.filter(id__lte=up_to_id)
+        last_read_id = messages.aggregate(last=Max('id'))['last']
+        if last_read_id is None:
+            return 0, None
+        marked = messages.filter(receiver_id=user_id, is_read=False).update(is_read=True)
+        changes = {
+            'unread_count': Greatest(F('unread_count') - marked, 0) if up_to_id is not None else 0,
+            'last_read_message_id': Greatest(Coalesce('last_read_message_id', 0), last_read_id),
+        }
+        states = ConversationReadState.objects.filter(conversation_id=conversation_id, user_id=user_id)
+        if not states.update(**changes):
+            ensure_read_states(conversation_id, [user_id])
+            states.update(**changes)
+    return marked, last_read_id
+
+def mark_conversation_read(conversation, user, up_to_id=None):
+    return mark_messages_read(conversation.id, user.id, up_to_id)
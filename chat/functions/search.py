@@ -0,0 +1,30 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+from chat.models import ArchivedMessage, Conversation, Message
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_CONFIG = 'english'
+
+def ranked_matches(model, query, conversations, count):
+    return list(
+        model.objects.filter(search_vector=query, conversation_id__in=conversations.values('id'))
+        .select_related('sender')
+        .defer('search_vector')
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline('content', query, config=SEARCH_CONFIG),
+        )
+        .order_by('-rank', '-created_at', '-id')[:count]
+    )
+
+def search_messages(user, text, limit, offset=0, conversation_id=None):
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    conversations = Conversation.objects.filter(participants=user)
+    if conversation_id is not None:
+        conversations = conversations.filter(id=conversation_id)
+    count = offset + limit + 1
+    matches = ranked_matches(Message, query, conversations, count) + ranked_matches(ArchivedMessage, query, conversations, count)
+    matches.sort(key=lambda message: (message.rank, message.created_at, message.id), reverse=True)
+    page = matches[offset:offset + limit + 1]
+    return page[:limit], len(page) > limit
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from chat.models import ArchivedMessage, Conversation, Message
+
+ARCHIVED_FIELDS = ['id', 'conversation_id', 'sender_id', 'receiver_id', 'content', 'is_read', 'created_at']
+
+class Command(BaseCommand):
+    help = 'Moves chat messages older than the retention window into the archive table in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS, help='Archive messages older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        started = time.monotonic()
+        moved = 0
+        while True:
+            count = self.archive_batch(cutoff, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            self.stdout.write(f'Archived {moved} messages...')
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} messages older than {cutoff:%Y-%m-%d} in {time.monotonic() - started:.1f}s.'))
+
+    def archive_batch(self, cutoff, batch_size):
+        with transaction.atomic():
+            rows = list(
+                Message.objects.select_for_update(skip_locked=True)
+                .filter(created_at__lt=cutoff)
+                .exclude(id__in=Conversation.objects.filter(last_message__isnull=False).values('last_message_id'))
+                .order_by('id')
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return 0
+            ArchivedMessage.objects.bulk_create([ArchivedMessage(**row) for row in rows], ignore_conflicts=True)
+            Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        return len(rows)
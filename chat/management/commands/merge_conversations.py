@@ -0,0 +1,55 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from chat.models import ArchivedMessage, Conversation, ConversationReadState, Message
+
+class Command(BaseCommand):
+    help = 'Backfills the (customer, therapist) pair key on conversations and merges duplicate conversations for the same pair.'
+
+    def handle(self, *args, **options):
+        Participant = Conversation.participants.through
+        members = defaultdict(dict)
+        rows = Participant.objects.order_by('conversation_id').values_list('conversation_id', 'userprofile_id', 'userprofile__role')
+        for conversation_id, user_id, role in rows.iterator(chunk_size=5000):
+            members[conversation_id][role] = user_id
+        pairs = defaultdict(list)
+        for conversation_id, roles in members.items():
+            if 'customer' in roles and 'therapist' in roles:
+                pairs[(roles['customer'], roles['therapist'])].append(conversation_id)
+        keyed = {
+            (customer_id, therapist_id): conversation_id
+            for conversation_id, customer_id, therapist_id in Conversation.objects.filter(customer__isnull=False, therapist__isnull=False).values_list('id', 'customer_id', 'therapist_id')
+        }
+
+        merged = backfilled = 0
+        for pair, conversation_ids in pairs.items():
+            survivor = keyed.get(pair, min(conversation_ids))
+            duplicates = [conversation_id for conversation_id in conversation_ids if conversation_id != survivor]
+            if not duplicates and pair in keyed:
+                continue
+            with transaction.atomic():
+                if duplicates:
+                    self.merge(survivor, duplicates)
+                    merged += len(duplicates)
+                if pair not in keyed:
+                    Conversation.objects.filter(id=survivor).update(customer_id=pair[0], therapist_id=pair[1])
+                    backfilled += 1
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {backfilled} pair keys and merged {merged} duplicate conversations.'))
+
+    def merge(self, survivor, duplicates):
+        Message.objects.filter(conversation_id__in=duplicates).update(conversation_id=survivor)
+        ArchivedMessage.objects.filter(conversation_id__in=duplicates).update(conversation_id=survivor)
+        unread = (
+            ConversationReadState.objects.filter(conversation_id__in=[survivor, *duplicates])
+            .order_by()
+            .values('user_id')
+            .annotate(total=Sum('unread_count'))
+        )
+        for row in unread:
+            ConversationReadState.objects.update_or_create(conversation_id=survivor, user_id=row['user_id'], defaults={'unread_count': row['total']})
+        ConversationReadState.objects.filter(conversation_id__in=duplicates).delete()
+        Conversation.objects.filter(id__in=duplicates).delete()
+        latest = Message.objects.filter(conversation_id=survivor).order_by('-created_at', '-id').first()
+        if latest:
+            Conversation.objects.filter(id=survivor).update(last_message=latest, updated_at=latest.created_at)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from chat.models import Conversation, ConversationReadState, Message
+
+class Command(BaseCommand):
+    help = 'Recomputes per-participant unread counters from Message.is_read.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        Participant = Conversation.participants.through
+        last_id = 0
+        rebuilt = 0
+        while True:
+            conversation_ids = list(Conversation.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not conversation_ids:
+                break
+            last_id = conversation_ids[-1]
+            unread = {
+                (row['conversation_id'], row['receiver_id']): row['n']
+                for row in Message.objects.filter(conversation_id__in=conversation_ids, is_read=False)
+                .order_by()
+                .values('conversation_id', 'receiver_id')
+                .annotate(n=Count('id'))
+            }
+            states = [
+                ConversationReadState(conversation_id=conversation_id, user_id=user_id, unread_count=unread.get((conversation_id, user_id), 0))
+                for conversation_id, user_id in Participant.objects.filter(conversation_id__in=conversation_ids).values_list('conversation_id', 'userprofile_id')
+            ]
+            ConversationReadState.objects.bulk_create(
+                states,
+                update_conflicts=True,
+                unique_fields=['conversation', 'user'],
+                update_fields=['unread_count'],
+            )
+            rebuilt += len(states)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} read states.'))
@@ -0,0 +1,45 @@
+import time
+from functools import lru_cache
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from User.functions.user_cache import get_cached_user
+
+BEARER_SUBPROTOCOL = 'bearer'
+
+def token_from_scope(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0], None
+    protocols = scope.get('subprotocols') or []
+    for i, protocol in enumerate(protocols[:-1]):
+        if protocol.lower() == BEARER_SUBPROTOCOL:
+            return protocols[i + 1], protocol
+    return None, None
+
+@lru_cache(maxsize=4096)
+def decode_token(raw):
+    token = AccessToken(raw)
+    return token[api_settings.USER_ID_CLAIM], token['exp']
+
+@database_sync_to_async
+def user_for_token(raw):
+    try:
+        user_id, expires = decode_token(raw)
+    except (TokenError, KeyError):
+        return None
+    if expires <= time.time():
+        return None
+    return get_cached_user(user_id)
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        raw, subprotocol = token_from_scope(scope)
+        if raw:
+            user = await user_for_token(raw)
+            if user is not None:
+                scope = dict(scope, user=user, auth_subprotocol=subprotocol)
+        return await super().__call__(scope, receive, send)
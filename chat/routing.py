@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<customer_id>\d+)/(?P<therapist_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/inbox/$', consumers.InboxConsumer.as_asgi()),
 ]
\ No newline at end of file
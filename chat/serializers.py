@@ -1,14 +1,18 @@
 from rest_framework import serializers
-from .models import Conversation, Message
+from .models import Conversation, Message, ConversationReadState
 from User.serializers import UserMinimalSerializer
 
 class MessageSerializer(serializers.ModelSerializer):
     sender_details = UserMinimalSerializer(source='sender', read_only=True)
     class Meta:
         model = Message
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('id', 'sender', 'created_at')
 
+class MessageSearchSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
 class ConversationSerializer(serializers.ModelSerializer):
     participants_details = UserMinimalSerializer(source='participants', many=True, read_only=True)
     last_message_content = serializers.SerializerMethodField()
@@ -22,5 +26,8 @@ class ConversationSerializer(serializers.ModelSerializer):
             return MessageSerializer(obj.last_message).data
         return None
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread'):
+            return obj.unread
         user = self.context['request'].user
-        return Message.objects.filter(receiver=user, sender__in=obj.participants.exclude(id=user.id), is_read=False).count()
\ No newline at end of file
+        state = ConversationReadState.objects.filter(conversation=obj, user=user).values_list('unread_count', flat=True).first()
+        return state or 0
\ No newline at end of file
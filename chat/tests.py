@@ -1,3 +1,356 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from chat.consumers import InboxConsumer
+from chat.models import ArchivedMessage, Conversation, ConversationReadState, Message
+from chat.functions.ids import parse_id
+from chat.functions.message_buffer import MessageBuffer, persist_batch
+from chat.functions.read_state import ensure_read_states, mark_messages_read
+from chat.functions.search import search_messages
 
-# Create your tests here.
+class MessageBufferTests(SimpleTestCase):
+    def buffer(self, max_pending=10, max_attempts=3):
+        buffer = MessageBuffer(interval=60, max_size=100, max_pending=max_pending, max_attempts=max_attempts)
+        buffer.ensure_running = lambda: None
+        return buffer
+
+    def contents(self, buffer):
+        return [message.content for _, message in buffer.pending]
+
+    async def test_failed_batches_are_retried_then_dropped(self):
+        buffer = self.buffer()
+        await buffer.add(1, 1, 2, 'hello')
+        with mock.patch('chat.functions.message_buffer.persist_messages', side_effect=OperationalError), self.assertLogs('chat.functions.message_buffer', 'ERROR'):
+            for _ in range(2):
+                await buffer.flush()
+                self.assertEqual(self.contents(buffer), ['hello'])
+            await buffer.flush()
+        self.assertEqual(buffer.pending, [])
+
+    async def test_buffer_drops_oldest_messages_when_full(self):
+        buffer = self.buffer(max_pending=2)
+        with self.assertLogs('chat.functions.message_buffer', 'ERROR'):
+            for content in ('a', 'b', 'c'):
+                await buffer.add(1, 1, 2, content)
+        self.assertEqual(self.contents(buffer), ['b', 'c'])
+
+    async def test_successful_flush_empties_buffer(self):
+        buffer = self.buffer()
+        await buffer.add(1, 1, 2, 'hello')
+        with mock.patch('chat.functions.message_buffer.persist_messages', side_effect=lambda messages: messages) as persist:
+            created = await buffer.flush()
+        self.assertEqual([message.content for message in created], ['hello'])
+        self.assertEqual(persist.call_count, 1)
+        self.assertEqual(buffer.pending, [])
+
+class ParseIdTests(SimpleTestCase):
+    def test_parses_integers(self):
+        self.assertEqual(parse_id(' 42 '), 42)
+        self.assertEqual(parse_id(7), 7)
+
+    def test_rejects_non_integers(self):
+        for value in ('', 'abc', '4.2', '²', None, [1]):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_id(value))
+
+class ChatDataMixin:
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.customer = User.objects.create_user('Customer', email='customer@roomspa.test', password='secret', role='customer')
+        self.therapist = User.objects.create_user('Therapist', email='therapist@roomspa.test', password='secret', role='therapist')
+        self.conversation = self.conversation_between(self.customer, self.therapist)
+
+    def conversation_between(self, customer, therapist):
+        conversation = Conversation.objects.create(customer=customer, therapist=therapist)
+        conversation.participants.add(customer, therapist)
+        ensure_read_states(conversation.id, [customer.id, therapist.id])
+        return conversation
+
+    def send(self, content, sender=None, conversation=None, created_at=None):
+        conversation = conversation or self.conversation
+        sender = sender or self.customer
+        receiver_id = conversation.therapist_id if sender.id == conversation.customer_id else conversation.customer_id
+        message = persist_batch([Message(conversation=conversation, sender=sender, receiver_id=receiver_id, content=content)])[0]
+        if created_at is not None:
+            Message.objects.filter(id=message.id).update(created_at=created_at)
+            message.created_at = created_at
+        return message
+
+    def read_state(self, user, conversation=None):
+        return ConversationReadState.objects.get(conversation=conversation or self.conversation, user=user)
+
+class ArchiveMessagesTests(ChatDataMixin, TestCase):
+    def archive(self):
+        call_command('archive_messages', '--days', '30', '--sleep', '0', stdout=io.StringIO())
+
+    def test_archiving_keeps_read_pointers(self):
+        old = timezone.now() - timedelta(days=60)
+        first = self.send('first', created_at=old)
+        self.send('second', created_at=old)
+        latest = self.send('latest')
+        mark_messages_read(self.conversation.id, self.therapist.id, first.id)
+        self.archive()
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [latest.id])
+        self.assertEqual(self.read_state(self.therapist).last_read_message_id, first.id)
+
+    def test_search_includes_archived_messages(self):
+        archived = self.send('Booking for a thai massage', created_at=timezone.now() - timedelta(days=60))
+        hot = self.send('Your booking is confirmed')
+        self.archive()
+        page, has_more = search_messages(self.customer, 'booking', 10)
+        self.assertEqual({message.id for message in page}, {archived.id, hot.id})
+        self.assertFalse(has_more)
+
+class ChatHistoryTests(ChatDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        old = timezone.now() - timedelta(days=60)
+        tie = timezone.now() - timedelta(minutes=5)
+        self.messages = [self.send(f'old {i}', created_at=old) for i in range(3)]
+        self.messages += [self.send(f'tie {i}', created_at=tie) for i in range(4)]
+        self.messages.append(self.send('latest'))
+        call_command('archive_messages', '--days', '30', '--sleep', '0', stdout=io.StringIO())
+
+    def page(self, **params):
+        response = self.client.get(reverse('conversation-messages'), {'conversation_id': self.conversation.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.data['results']], response.data['has_more']
+
+    def test_paging_backwards_visits_every_message_once(self):
+        seen, has_more, params = [], True, {}
+        while has_more:
+            ids, has_more = self.page(limit=3, **params)
+            seen = ids + seen
+            params = {'before': ids[0]}
+        self.assertEqual(seen, [message.id for message in self.messages])
+
+    def test_paging_forwards_visits_every_message_once(self):
+        seen, has_more = [self.messages[0].id], True
+        while has_more:
+            ids, has_more = self.page(limit=2, after=seen[-1])
+            seen += ids
+        self.assertEqual(seen, [message.id for message in self.messages])
+
+    def test_limit_is_clamped_and_pivot_must_belong_to_conversation(self):
+        ids, has_more = self.page(limit=0)
+        self.assertEqual(ids, [self.messages[-1].id])
+        self.assertTrue(has_more)
+        other = self.conversation_between(self.customer, get_user_model().objects.create_user('Other', email='other@roomspa.test', password='secret', role='therapist'))
+        foreign = self.send('elsewhere', conversation=other)
+        response = self.client.get(reverse('conversation-messages'), {'conversation_id': self.conversation.id, 'before': foreign.id})
+        self.assertEqual(response.status_code, 400)
+
+class UnreadCounterTests(ChatDataMixin, TestCase):
+    def test_counters_follow_sends_and_reads(self):
+        messages = [self.send(f'message {i}') for i in range(3)]
+        self.send('reply', sender=self.therapist)
+        self.assertEqual(self.read_state(self.therapist).unread_count, 3)
+        self.assertEqual(self.read_state(self.customer).unread_count, 1)
+        mark_messages_read(self.conversation.id, self.therapist.id, messages[1].id)
+        self.assertEqual(self.read_state(self.therapist).unread_count, 1)
+        mark_messages_read(self.conversation.id, self.therapist.id, messages[1].id)
+        self.assertEqual(self.read_state(self.therapist).unread_count, 1)
+        mark_messages_read(self.conversation.id, self.therapist.id)
+        self.assertEqual(self.read_state(self.therapist).unread_count, 0)
+        self.assertEqual(self.read_state(self.customer).unread_count, 1)
+
+    def test_conversation_list_query_count_does_not_grow(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.send('hello', sender=self.therapist)
+
+        def list_conversations():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('conversation-list'))
+            self.assertEqual(response.status_code, 200)
+            return response.data, len(queries)
+
+        data, baseline = list_conversations()
+        self.assertEqual([row['unread_count'] for row in data], [1])
+        User = get_user_model()
+        for i in range(3):
+            therapist = User.objects.create_user(f'Therapist {i}', email=f'therapist{i}@roomspa.test', password='secret', role='therapist')
+            conversation = self.conversation_between(self.customer, therapist)
+            for _ in range(i + 1):
+                self.send('hi', sender=therapist, conversation=conversation)
+        data, queries = list_conversations()
+        self.assertEqual(queries, baseline)
+        self.assertEqual(sorted(row['unread_count'] for row in data), [1, 1, 2, 3])
+
+class MergeConversationsTests(ChatDataMixin, TestCase):
+    def legacy_conversation(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.customer, self.therapist)
+        ensure_read_states(conversation.id, [self.customer.id, self.therapist.id])
+        return conversation
+
+    def merge(self):
+        call_command('merge_conversations', stdout=io.StringIO())
+
+    def test_duplicates_fold_into_the_keyed_conversation(self):
+        self.send('keyed')
+        duplicate = self.legacy_conversation()
+        latest = persist_batch([Message(conversation=duplicate, sender=self.customer, receiver=self.therapist, content='legacy')])[0]
+        self.merge()
+        self.assertEqual(list(Conversation.objects.values_list('id', flat=True)), [self.conversation.id])
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 2)
+        self.assertEqual(self.read_state(self.therapist).unread_count, 2)
+        self.assertEqual(ConversationReadState.objects.count(), 2)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, latest.id)
+
+    def test_unkeyed_conversations_get_the_pair_key(self):
+        self.conversation.delete()
+        first, second = self.legacy_conversation(), self.legacy_conversation()
+        self.merge()
+        survivor = Conversation.objects.get()
+        self.assertEqual(survivor.id, min(first.id, second.id))
+        self.assertEqual((survivor.customer_id, survivor.therapist_id), (self.customer.id, self.therapist.id))
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_WRITE_BEHIND=False,
+    CHAT_READ_RECEIPT_DELAY=0.05,
+)
+class ConsumerTests(TransactionTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user('Customer', email='customer@roomspa.test', password='secret', role='customer')
+        self.therapist = User.objects.create_user('Therapist', email='therapist@roomspa.test', password='secret', role='therapist')
+
+    async def test_pair_key_lookup_reuses_the_conversation(self):
+        consumer = InboxConsumer()
+        first = await consumer.get_or_create_conversation(self.customer.id, self.therapist.id)
+        second = await consumer.get_or_create_conversation(self.customer.id, self.therapist.id)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(await Conversation.objects.acount(), 1)
+        self.assertEqual(await first.participants.acount(), 2)
+        self.assertEqual(await ConversationReadState.objects.filter(conversation=first).acount(), 2)
+
+    async def connect(self, user):
+        socket = ApplicationCommunicator(InboxConsumer.as_asgi(), {'type': 'websocket', 'path': '/ws/inbox/', 'user': user, 'subprotocols': []})
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(1))['type'], 'websocket.accept')
+        return socket
+
+    async def disconnect(self, *sockets):
+        for socket in sockets:
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(1)
+
+    async def send(self, socket, **frame):
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps(frame)})
+
+    async def receive(self, socket):
+        return json.loads((await socket.receive_output(1))['text'])
+
+    async def test_inbox_fans_messages_out_to_both_participants(self):
+        customer, therapist = await self.connect(self.customer), await self.connect(self.therapist)
+        await self.send(customer, recipient_id=self.therapist.id, message='hello')
+        sent, received = await self.receive(customer), await self.receive(therapist)
+        self.assertEqual(sent, received)
+        self.assertEqual((received['message'], received['sender_id']), ('hello', self.customer.id))
+        conversation = await Conversation.objects.aget()
+        self.assertEqual(received['conversation_id'], conversation.id)
+        await self.send(therapist, conversation_id=conversation.id, message='welcome')
+        reply = await self.receive(customer)
+        self.assertEqual((reply['message'], reply['sender_id']), ('welcome', self.therapist.id))
+        self.assertEqual(await self.receive(therapist), reply)
+        self.assertEqual(await Message.objects.filter(conversation=conversation).acount(), 2)
+        await self.disconnect(customer, therapist)
+
+    async def test_inbox_rejects_foreign_conversations(self):
+        User = get_user_model()
+        other = await User.objects.acreate(name='Other', email='other@roomspa.test', role='customer')
+        foreign = await InboxConsumer().get_or_create_conversation(other.id, self.therapist.id)
+        customer = await self.connect(self.customer)
+        await self.send(customer, conversation_id=foreign.id, message='hello')
+        self.assertEqual(await self.receive(customer), {'error': 'Conversation not found.'})
+        self.assertFalse(await Message.objects.aexists())
+        await self.disconnect(customer)
+
+    async def test_read_acks_are_coalesced_into_one_update(self):
+        conversation = await InboxConsumer().get_or_create_conversation(self.customer.id, self.therapist.id)
+        messages = [(await database_sync_to_async(persist_batch)([Message(conversation=conversation, sender=self.customer, receiver=self.therapist, content=str(i))]))[0] for i in range(3)]
+        customer, therapist = await self.connect(self.customer), await self.connect(self.therapist)
+        with mock.patch('chat.consumers.mark_messages_read', wraps=mark_messages_read) as mark:
+            for message in messages:
+                await self.send(therapist, action='mark_read', conversation_id=conversation.id, message_id=message.id)
+            receipt = await self.receive(customer)
+        mark.assert_called_once_with(conversation.id, self.therapist.id, messages[-1].id)
+        self.assertEqual(receipt['last_read_message_id'], messages[-1].id)
+        self.assertTrue(await therapist.receive_nothing(0.2))
+        self.assertFalse(await Message.objects.filter(is_read=False).aexists())
+        await self.disconnect(customer, therapist)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MarkReadTests(ChatDataMixin, TestCase):
+    def test_marking_read_issues_one_message_update(self):
+        messages = [self.send(f'message {i}') for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            marked, last_read_id = mark_messages_read(self.conversation.id, self.therapist.id)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "chat_message"')]
+        self.assertEqual((marked, last_read_id), (5, messages[-1].id))
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.read_state(self.therapist).last_read_message_id, messages[-1].id)
+
+    def test_view_reports_the_remaining_unread_count(self):
+        messages = [self.send(f'message {i}') for i in range(3)]
+        client = APIClient()
+        client.force_authenticate(self.therapist)
+        response = client.post(reverse('mark-read'), {'conversation_id': self.conversation.id, 'message_id': messages[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['marked'], response.data['unread_count']), (1, 2))
+
+class MessageSearchTests(ChatDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        User = get_user_model()
+        stranger = User.objects.create_user('Stranger', email='stranger@roomspa.test', password='secret', role='customer')
+        self.foreign = self.conversation_between(stranger, self.therapist)
+        self.send('massage massage massage', sender=stranger, conversation=self.foreign)
+
+    def search(self, **params):
+        response = self.client.get(reverse('message-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_are_ranked_and_limited_to_own_conversations(self):
+        weak = self.send('Is a massage possible on Friday evening after the gym session?')
+        strong = self.send('massage, deep tissue massage')
+        self.send('See you then')
+        data = self.search(q='massage')
+        self.assertEqual([row['id'] for row in data['results']], [strong.id, weak.id])
+        self.assertGreater(data['results'][0]['rank'], data['results'][1]['rank'])
+        self.assertIn('<b>', data['results'][0]['headline'])
+
+    def test_foreign_conversation_filter_returns_nothing(self):
+        self.send('massage')
+        self.assertEqual(self.search(q='massage', conversation_id=self.foreign.id)['results'], [])
+        self.assertEqual(len(self.search(q='massage', conversation_id=self.conversation.id)['results']), 1)
+
+    def test_offset_pages_through_matches(self):
+        sent = [self.send(f'massage {i}') for i in range(3)]
+        first, second = self.search(q='massage', limit=2), self.search(q='massage', limit=2, offset=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(first['next_offset'], 2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual({row['id'] for row in first['results'] + second['results']}, {message.id for message in sent})
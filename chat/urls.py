@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('conversations/', views.conversation_list, name='conversation-list'),
     path('messages/', views.conversation_messages, name='conversation-messages'),
+    path('mark-read/', views.mark_read, name='mark-read'),
+    path('search/', views.message_search, name='message-search'),
 ]
\ No newline at end of file
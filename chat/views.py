@@ -2,14 +2,31 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Conversation, Message
-from .serializers import ConversationSerializer, MessageSerializer
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import ArchivedMessage, Conversation, Message, ConversationReadState
+from .serializers import ConversationSerializer, MessageSerializer, MessageSearchSerializer
+from .functions.history import find_pivot, history_page, MESSAGE_PAGE_SIZE, MESSAGE_MAX_PAGE_SIZE
+from .functions.search import search_messages, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+from .functions.read_state import mark_conversation_read
+from .functions.ids import parse_id
+from .consumers import send_read_receipt
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def conversation_list(request):
     user = request.user
-    conversations = Conversation.objects.filter(participants=user).order_by('-updated_at')
+    unread = ConversationReadState.objects.filter(conversation=OuterRef('pk'), user=user).values('unread_count')[:1]
+    conversations = (
+        Conversation.objects.filter(participants=user)
+        .select_related('last_message__sender')
+        .defer('last_message__search_vector')
+        .prefetch_related('participants')
+        .annotate(unread=Coalesce(Subquery(unread), 0))
+        .order_by('-updated_at')
+    )
     serializer = ConversationSerializer(conversations, many=True, context={'request': request})
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -19,12 +36,78 @@ def conversation_messages(request):
     conversation_id = request.query_params.get('conversation_id', '').strip()
     if not conversation_id:
         return Response({'message': 'conversation_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        conversation = Conversation.objects.get(id=conversation_id)
-    except Conversation.DoesNotExist:
+    conversation_id = parse_id(conversation_id)
+    conversation = Conversation.objects.filter(id=conversation_id).first() if conversation_id is not None else None
+    if conversation is None:
         return Response({'message': 'Conversation not found.'}, status=status.HTTP_404_NOT_FOUND)
-    if request.user not in conversation.participants.all():
+    if not conversation.participants.filter(id=request.user.id).exists():
         return Response({'message': 'User not a participant of this conversation.'}, status=status.HTTP_403_FORBIDDEN)
-    messages = Message.objects.filter(conversation=conversation)
-    serializer = MessageSerializer(messages, many=True, context={'request': request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    if not any(param in request.query_params for param in ('before', 'after', 'limit')):
+        messages = list(ArchivedMessage.objects.filter(conversation=conversation).select_related('sender').defer('search_vector'))
+        messages += Message.objects.filter(conversation=conversation).select_related('sender').defer('search_vector')
+        serializer = MessageSerializer(messages, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    try:
+        limit = min(max(int(request.query_params.get('limit', MESSAGE_PAGE_SIZE)), 1), MESSAGE_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'message': 'limit must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+    pivots = {}
+    for param in ('before', 'after'):
+        if not request.query_params.get(param, '').strip():
+            continue
+        message_id = parse_id(request.query_params[param])
+        pivot = find_pivot(conversation, message_id) if message_id is not None else None
+        if pivot is None:
+            return Response({'message': f'{param} must be a message id in this conversation.'}, status=status.HTTP_400_BAD_REQUEST)
+        pivots[param] = pivot
+    page, has_more = history_page(conversation, limit, **pivots)
+    serializer = MessageSerializer(page, many=True, context={'request': request})
+    return Response({'results': serializer.data, 'has_more': has_more}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_read(request):
+    conversation_id = str(request.data.get('conversation_id', '')).strip()
+    if not conversation_id:
+        return Response({'message': 'conversation_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    conversation_id = parse_id(conversation_id)
+    conversation = Conversation.objects.filter(id=conversation_id, participants=request.user).first() if conversation_id is not None else None
+    if not conversation:
+        return Response({'message': 'Conversation not found.'}, status=status.HTTP_404_NOT_FOUND)
+    message_id = str(request.data.get('message_id', '') or '').strip()
+    up_to_id = parse_id(message_id) if message_id else None
+    if message_id and up_to_id is None:
+        return Response({'message': 'message_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    marked, last_read_id = mark_conversation_read(conversation, request.user, up_to_id)
+    if marked:
+        async_to_sync(send_read_receipt)(get_channel_layer(), conversation, request.user.id, last_read_id)
+    unread_count = ConversationReadState.objects.filter(conversation=conversation, user=request.user).values_list('unread_count', flat=True).first() or 0
+    return Response({
+        'message': 'Conversation marked as read.',
+        'marked': marked,
+        'last_read_message_id': last_read_id,
+        'unread_count': unread_count,
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def message_search(request):
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'message': 'q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    raw_conversation_id = request.query_params.get('conversation_id', '').strip()
+    conversation_id = parse_id(raw_conversation_id) if raw_conversation_id else None
+    if raw_conversation_id and conversation_id is None:
+        return Response({'message': 'conversation_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return Response({'message': 'limit and offset must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+    page, has_more = search_messages(request.user, query, limit, offset, conversation_id)
+    serializer = MessageSearchSerializer(page, many=True, context={'request': request})
+    return Response({
+        'results': serializer.data,
+        'has_more': has_more,
+        'next_offset': offset + limit if has_more else None,
+    }, status=status.HTTP_200_OK)
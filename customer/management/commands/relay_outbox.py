@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from customer.models import OutboxEvent
+from User.functions.kafka_producer import get_producer, close_producer, publish
+
+class Command(BaseCommand):
+    help = 'Publishes pending outbox events to Kafka in batches, retrying failures with exponential backoff. Several relays can run in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--flush-timeout', type=float, default=10.0)
+        parser.add_argument('--backoff', type=float, default=5.0, help='Base retry delay in seconds, doubled per attempt.')
+        parser.add_argument('--max-backoff', type=float, default=600.0)
+        parser.add_argument('--lease', type=float, default=60.0, help='Seconds a claimed event stays hidden from other relays while it is being published.')
+        parser.add_argument('--retention-hours', type=int, default=24, help='Published events older than this are deleted.')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                published = self.relay_batch(options)
+                if published:
+                    continue
+                self.purge_published(options['retention_hours'], options['batch_size'])
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            close_producer()
+
+    def claim_batch(self, options):
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True, failed_at__isnull=True, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:options['batch_size']]
+            )
+            if events:
+                OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(next_attempt_at=now + timedelta(seconds=options['lease']))
+        return events
+
+    def relay_batch(self, options):
+        events = self.claim_batch(options)
+        if not events:
+            return 0
+        sent = [(event, publish(event.topic, event.payload, key=event.key)) for event in events]
+        try:
+            get_producer().flush(timeout=options['flush_timeout'])
+        except Exception:
+            pass
+        published, failed = [], []
+        for event, future in sent:
+            try:
+                if future is None:
+                    raise RuntimeError('Failed to enqueue message')
+                future.get(timeout=0)
+                published.append(event.id)
+            except Exception as e:
+                failed.append((event, e))
+        now = timezone.now()
+        if published:
+            OutboxEvent.objects.filter(id__in=published).update(published_at=now)
+        for event, error in failed:
+            event.attempts += 1
+            event.last_error = str(error) or error.__class__.__name__
+            if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                event.failed_at = now
+            else:
+                delay = min(options['backoff'] * 2 ** (event.attempts - 1), options['max_backoff'])
+                event.next_attempt_at = now + timedelta(seconds=delay)
+        OutboxEvent.objects.bulk_update([event for event, _ in failed], ['attempts', 'last_error', 'failed_at', 'next_attempt_at'])
+        self.stdout.write(f'Published {len(published)} events, {len(failed)} failed.')
+        if failed and not published:
+            return 0
+        return len(published)
+
+    def purge_published(self, retention_hours, batch_size):
+        cutoff = timezone.now() - timedelta(hours=retention_hours)
+        ids = list(OutboxEvent.objects.filter(published_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+        if ids:
+            OutboxEvent.objects.filter(id__in=ids).delete()
@@ -1,7 +1,29 @@
 from django.db import models
+from django.db.models import F, Func, Q
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.fields import DateTimeRangeField, RangeBoundary
+from django.contrib.postgres.indexes import GistIndex
+from psycopg2.extras import DateTimeTZRange
 import uuid
 
+ACTIVE_BOOKING_STATUSES = ['pending', 'active', 'started']
+
+class TsTzRange(Func):
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+def booking_slot():
+    return TsTzRange('time_slot_from', 'time_slot_to', RangeBoundary())
+
+class BookingQuerySet(models.QuerySet):
+    def overlapping(self, start, end):
+        return self.filter(status__in=ACTIVE_BOOKING_STATUSES).annotate(slot=booking_slot()).filter(slot__overlap=DateTimeTZRange(start, end))
+
+    def busy_therapist_ids(self, start, end):
+        return self.overlapping(start, end).order_by().values_list('therapist_id', flat=True).distinct()
+
 class CustomerAddress(models.Model):
     customer = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='customer_address')
     name = models.CharField(max_length=100, db_index=True)
@@ -39,11 +61,18 @@ class Booking(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
+
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['therapist', 'status']),
             models.Index(fields=['customer', 'status']),
+            GistIndex(booking_slot(), name='booking_active_slot_gist', condition=Q(status__in=ACTIVE_BOOKING_STATUSES)),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(time_slot_from__lt=F('time_slot_to')), name='booking_slot_from_before_to'),
         ]
         ordering = ['-created_at']
 
@@ -66,4 +95,21 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=['status', 'created_at']),
         ]
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class OutboxEvent(models.Model):
+    topic = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, null=True, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='outbox_pending_idx', condition=Q(published_at__isnull=True, failed_at__isnull=True)),
+            models.Index(fields=['published_at']),
+        ]
+        ordering = ['id']
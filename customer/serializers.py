@@ -11,6 +11,12 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = '__all__'
         read_only_fields = ['id', 'created_at']
+    def validate(self, data):
+        slot_from = data.get('time_slot_from', getattr(self.instance, 'time_slot_from', None))
+        slot_to = data.get('time_slot_to', getattr(self.instance, 'time_slot_to', None))
+        if slot_from and slot_to and slot_from >= slot_to:
+            raise serializers.ValidationError({'time_slot_to': 'time_slot_to must be after time_slot_from.'})
+        return data
 
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,6 +29,7 @@ class TherapistDetailSerializer(serializers.Serializer):
     name = serializers.CharField()
     email = serializers.EmailField(allow_null=True)
     address = serializers.CharField()
+    distance = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, required=False)
     services = serializers.JSONField()
 
 class CustomerProfileSerializer(serializers.Serializer):
@@ -1,3 +1,201 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from decimal import Decimal
+from rest_framework.test import APIClient
+from therapist.models import Location, Services
+from therapist.functions.search_index import invalidate_search_snapshot
+from User.functions.kafka_producer import InMemoryProducer, set_producer
+from .models import Booking, OutboxEvent
 
-# Create your tests here.
+class BrokenProducer(InMemoryProducer):
+    def __init__(self, broken_keys=None):
+        super().__init__()
+        self.broken_keys = broken_keys
+
+    def send(self, topic, value=None, key=None):
+        if self.broken_keys is None or key in self.broken_keys:
+            raise ConnectionError(f'broker rejected {key}')
+        return super().send(topic, value=value, key=key)
+
+class RelayOutboxTests(TestCase):
+    def relay(self, producer, *args):
+        set_producer(producer)
+        self.addCleanup(set_producer, None)
+        call_command('relay_outbox', '--once', *args, stdout=io.StringIO())
+
+    def event(self, key):
+        return OutboxEvent.objects.create(topic='service_requests', key=key, payload={'event': 'booking_created', 'booking_id': key})
+
+    def test_publishes_pending_events(self):
+        event = self.event('b1')
+        producer = InMemoryProducer()
+        self.relay(producer)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.published_at)
+        self.assertEqual([(key, json.loads(value)) for key, value in producer.topics['service_requests']], [(b'b1', event.payload)])
+
+    def test_enqueue_failure_is_recorded_and_backed_off(self):
+        event = self.event('b1')
+        with self.assertLogs('User.functions.kafka_producer', 'ERROR'):
+            self.relay(BrokenProducer())
+        event.refresh_from_db()
+        self.assertIsNone(event.published_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertEqual(event.last_error, 'Failed to enqueue message')
+
+    def test_failing_event_does_not_block_the_outbox(self):
+        bad, good = self.event('bad'), self.event('good')
+        producer = BrokenProducer({'bad'})
+        with self.assertLogs('User.functions.kafka_producer', 'ERROR'):
+            self.relay(producer, '--batch-size', '1')
+            self.relay(producer, '--batch-size', '1')
+        bad.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual(bad.attempts, 1)
+        self.assertIsNotNone(good.published_at)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=1)
+    def test_event_is_parked_after_max_attempts(self):
+        event = self.event('b1')
+        with self.assertLogs('User.functions.kafka_producer', 'ERROR'):
+            self.relay(BrokenProducer())
+        event.refresh_from_db()
+        self.assertIsNotNone(event.failed_at)
+        self.assertIsNone(event.published_at)
+
+class BookingSlotTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user('Customer', email='customer@roomspa.test', password='secret', role='customer', verification_status=True)
+        self.therapist = User.objects.create_user('Therapist', email='therapist@roomspa.test', password='secret', role='therapist', verification_status=True)
+        self.start = timezone.now() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def booking(self, start, hours=1, status='pending'):
+        return Booking.objects.create(customer=self.customer, therapist=self.therapist, time_slot_from=start, time_slot_to=start + timedelta(hours=hours), services=['oil'], total=100, status=status)
+
+    def test_overlapping_only_returns_active_bookings_in_the_slot(self):
+        overlapping = self.booking(self.start)
+        self.booking(self.start + timedelta(hours=1))
+        self.booking(self.start, status='cancelled')
+        found = Booking.objects.overlapping(self.start + timedelta(minutes=30), self.start + timedelta(minutes=45))
+        self.assertEqual(list(found.values_list('id', flat=True)), [overlapping.id])
+        self.assertEqual(list(Booking.objects.busy_therapist_ids(self.start + timedelta(hours=2), self.start + timedelta(hours=3))), [])
+
+    def test_reversed_slot_is_rejected(self):
+        response = self.client.post(reverse('book_therapist'), {
+            'customer': self.customer.id,
+            'therapist': self.therapist.id,
+            'time_slot_from': (self.start + timedelta(hours=1)).isoformat(),
+            'time_slot_to': self.start.isoformat(),
+            'services': ['oil'],
+            'total': '100.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('time_slot_to', response.data)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_reversed_slot_violates_constraint(self):
+        with self.assertRaises(IntegrityError):
+            self.booking(self.start, hours=-1)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TherapistSearchTests(TestCase):
+    def setUp(self):
+        self.User = get_user_model()
+        self.customer = self.User.objects.create_user('Customer', email='customer@roomspa.test', password='secret', role='customer', verification_status=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def therapist(self, name, services, lat_offset='0.01', lon_offset='0', **fields):
+        fields.setdefault('verification_status', True)
+        user = self.User.objects.create_user(name, email=f'{name.lower()}@roomspa.test', password='secret', role='therapist', **fields)
+        Location.objects.create(user=user, address='Dubai', service_radius=Decimal('20'), latitude=Decimal('25.204800') + Decimal(lat_offset), longitude=Decimal('55.270800') + Decimal(lon_offset))
+        Services.objects.create(user=user, services=services)
+        return user
+
+    def search(self, **params):
+        invalidate_search_snapshot()
+        params = {'latitude': '25.2048', 'longitude': '55.2708', 'services': 'oil', **params}
+        response = self.client.get(reverse('search_therapists'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def search_both(self, **params):
+        with self.settings(THERAPIST_SEARCH_SNAPSHOT=True):
+            snapshot = self.search(**params)
+        with self.settings(THERAPIST_SEARCH_SNAPSHOT=False):
+            database = self.search(**params)
+        self.assertEqual(snapshot, database)
+        return snapshot
+
+    def test_snapshot_matches_the_database(self):
+        near = self.therapist('Near', {'oil': '100', 'foot': '80'})
+        second = self.therapist('Second', {'oil': '90'}, lat_offset='0.03')
+        self.therapist('Far', {'oil': '100'}, lat_offset='0.5')
+        foot = self.therapist('Foot', {'foot': '80'})
+        self.therapist('Unverified', {'oil': '100'}, verification_status=False)
+        self.therapist('Inactive', {'oil': '100'}, is_active=False)
+        results = self.search_both()
+        self.assertEqual([row['id'] for row in results], [near.id, second.id])
+        self.assertEqual([row['id'] for row in self.search_both(services='oil,foot')], [near.id, foot.id, second.id])
+
+    def test_cursor_pages_are_stable_across_ties_and_inserts(self):
+        for i, offset in enumerate(['0.01', '0.02', '0.02', '0.02', '0.04']):
+            self.therapist(f'Therapist{i}', {'oil': '100'}, lat_offset=offset)
+        expected = [row['id'] for row in self.search_both()]
+        first = self.search_both(limit=2)
+        self.therapist('Closer', {'oil': '100'}, lat_offset='0.001')
+        seen, cursor = [row['id'] for row in first['results']], first['next_cursor']
+        while cursor:
+            page = self.search_both(limit=2, cursor=cursor)
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get(reverse('search_therapists'), {'latitude': '25.2048', 'longitude': '55.2708', 'services': 'oil', 'cursor': 'nope'}).status_code, 400)
+
+    def test_booked_therapists_are_excluded_for_overlapping_slots(self):
+        busy = self.therapist('Busy', {'oil': '100'})
+        free = self.therapist('Free', {'oil': '100'}, lat_offset='0.02')
+        start = timezone.now() + timedelta(days=1)
+        Booking.objects.create(customer=self.customer, therapist=busy, time_slot_from=start, time_slot_to=start + timedelta(hours=1), services=['oil'], total=100)
+        Booking.objects.create(customer=self.customer, therapist=free, time_slot_from=start, time_slot_to=start + timedelta(hours=1), services=['oil'], total=100, status='cancelled')
+        slot = {'time_slot_from': (start + timedelta(minutes=30)).isoformat(), 'time_slot_to': (start + timedelta(hours=2)).isoformat()}
+        self.assertEqual([row['id'] for row in self.search_both(**slot)], [free.id])
+        later = {'time_slot_from': (start + timedelta(hours=1)).isoformat(), 'time_slot_to': (start + timedelta(hours=2)).isoformat()}
+        self.assertEqual([row['id'] for row in self.search_both(**later)], [busy.id, free.id])
+        response = self.client.get(reverse('search_therapists'), {'latitude': '25.2048', 'longitude': '55.2708', 'services': 'oil', 'time_slot_from': slot['time_slot_to'], 'time_slot_to': slot['time_slot_from']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_radius_edge_matches_haversine(self):
+        north = self.therapist('North', {'oil': '100'}, lat_offset='0.0895')
+        east = self.therapist('East', {'oil': '100'}, lat_offset='0', lon_offset='0.0985')
+        self.therapist('NorthOut', {'oil': '100'}, lat_offset='0.0905')
+        self.therapist('EastOut', {'oil': '100'}, lat_offset='0', lon_offset='0.0995')
+        results = self.search_both()
+        self.assertEqual({row['id'] for row in results}, {north.id, east.id})
+        self.assertTrue(all(row['distance'] <= 10 for row in results))
+
+    def test_results_keep_the_stored_services_shape(self):
+        services = {'oil': {'price': '120.00', 'duration': 60}, 'foot': '80'}
+        therapist = self.therapist('Therapist', services)
+        for snapshot in (True, False):
+            with self.subTest(snapshot=snapshot), self.settings(THERAPIST_SEARCH_SNAPSHOT=snapshot):
+                results = self.search()
+                self.assertEqual([(row['id'], row['services']) for row in results], [(therapist.id, services)])
+
+    def test_detail_reads_the_service_catalog(self):
+        therapist = self.therapist('Therapist', {'oil': {'price': '120.00', 'duration': 60}})
+        response = self.client.get(reverse('therapist_detail', args=[therapist.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['address'], 'Dubai')
+        self.assertEqual(list(response.data['services']), ['oil'])
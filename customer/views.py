@@ -1,18 +1,24 @@
-import math
-import json
-from django.db.models import Q
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from kafka import KafkaProducer
 from User.permissions import IsCustomer
-from .models import CustomerAddress, Booking, Transaction
+from .models import CustomerAddress, Booking, Transaction, OutboxEvent
 from chat.models import Conversation, Message
 from .serializers import CustomerAddressSerializer, BookingSerializer, TherapistDetailSerializer, CustomerProfileSerializer, TransactionSerializer
 from chat.serializers import ConversationSerializer, MessageSerializer
-from therapist.models import Services as TherapistServices, Location
+from therapist.models import Location, TherapistService
+from therapist.functions.geo import bounding_box_filter, within_radius
+from therapist.functions.search_index import get_search_snapshot, catalog_by_user, listings_by_user, select_nearest, encode_cursor, decode_cursor
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
 
 @api_view(['GET', 'POST', 'PUT'])
 @permission_classes([IsCustomer])
@@ -42,11 +48,10 @@ def customer_address_view(request):
 def book_therapist(request):
     serializer = BookingSerializer(data=request.data)
     if serializer.is_valid():
-        booking = serializer.save(customer=request.user)
-        producer = KafkaProducer(bootstrap_servers='localhost:9092', value_serializer=lambda v: json.dumps(v).encode('utf-8'))
-        data = {'booking_id': str(booking.id), 'customer_id': request.user.id, 'latitude': booking.latitude, 'longitude': booking.longitude, 'services': booking.services}
-        producer.send('service_requests', data)
-        producer.flush()
+        with transaction.atomic():
+            booking = serializer.save(customer=request.user)
+            data = {'event': 'booking_created', 'booking_id': str(booking.id), 'customer_id': request.user.id, 'latitude': booking.latitude, 'longitude': booking.longitude, 'services': booking.services}
+            OutboxEvent.objects.create(topic='service_requests', key=str(booking.id), payload=data)
         return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -55,14 +60,13 @@ def book_therapist(request):
 def therapist_detail_view(request, therapist_id):
     User = get_user_model()
     therapist = get_object_or_404(User, id=therapist_id)
-    loc = None
-    serv_obj = None
+    loc = Location.objects.filter(user=therapist).first()
     data = {
         'id': therapist.id,
-        'name': therapist.get_full_name() or therapist.username,
+        'name': therapist.name,
         'email': therapist.email,
         'address': loc.address if loc else '',
-        'services': serv_obj.services if serv_obj else []
+        'services': catalog_by_user([therapist.id]).get(therapist.id, {})
     }
     serializer = TherapistDetailSerializer(data)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -73,7 +77,10 @@ def cancel_booking_view(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, customer=request.user)
     booking.status = 'cancelled'
     booking.cancellation_reason = request.data.get('reason', '')
-    booking.save()
+    with transaction.atomic():
+        booking.save()
+        data = {'event': 'booking_cancelled', 'booking_id': str(booking.id), 'customer_id': request.user.id}
+        OutboxEvent.objects.create(topic='service_requests', key=str(booking.id), payload=data)
     return Response(BookingSerializer(booking).data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
@@ -92,6 +99,39 @@ def customer_profile_view(request):
     serializer = CustomerProfileSerializer(data)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+def search_database(user_lat, user_lon, search_radius, service_list, limit=None, after=None, exclude=None):
+    therapist_ids = TherapistService.objects.filter(service__in=service_list).values('user_id')
+    locations = Location.objects.filter(
+        bounding_box_filter(user_lat, user_lon, search_radius),
+        user_id__in=therapist_ids,
+        user__role='therapist',
+        user__verification_status=True,
+        user__is_active=True,
+    )
+    if exclude is not None:
+        locations = locations.exclude(user_id__in=exclude)
+    rows = list(locations.values_list('user_id', 'latitude', 'longitude', 'service_radius', 'address', 'user__name', 'user__email'))
+    coords = np.array([row[1:4] for row in rows], dtype=np.float64).reshape(-1, 3)
+    mask, distances = within_radius(user_lat, user_lon, coords[:, 0], coords[:, 1], search_radius, coords[:, 2])
+    hits = np.flatnonzero(mask)
+    candidates = ((float(distances[i]), rows[i][0], i) for i in hits)
+    nearest = select_nearest(candidates, limit, after)
+    
+    services_by_user = listings_by_user(user_id for _, user_id, _ in nearest)
+    results = []
+    for distance, user_id, i in nearest:
+        _, _, _, _, address, name, email = rows[i]
+        data = {
+            'id': user_id,
+            'name': name, 
+            'email': email,
+            'address': address,
+            'distance': distance,
+            'services': services_by_user.get(user_id, [])
+        }
+        results.append(data)
+    return results
+
 @api_view(['GET'])
 @permission_classes([IsCustomer])
 def search_therapists_view(request):
@@ -110,45 +150,49 @@ def search_therapists_view(request):
         return Response({'error': 'Invalid coordinates or radius'}, status=status.HTTP_400_BAD_REQUEST)
     
     service_list = [s.strip() for s in services_param.split(',') if s.strip()]
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371 
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        dphi = math.radians(lat2 - lat1)
-        dlambda = math.radians(lon2 - lon1)
-        a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-    
-    qs = TherapistServices.objects.all()
-    query = Q(services__icontains=service_list[0]) if service_list else None
-    for s in service_list[1:]:
-        query |= Q(services__icontains=s)
-    if query:
-        qs = qs.filter(query)
+    paginate = 'limit' in request.query_params or 'cursor' in request.query_params
+    limit = None
+    after = None
+    if paginate:
+        try:
+            limit = min(max(int(request.query_params.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('cursor'):
+            after = decode_cursor(request.query_params['cursor'])
+            if after is None:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
     
-    therapist_ids = qs.values_list('user_id', flat=True)
-    locations = Location.objects.filter(user_id__in=therapist_ids)
-    results = []
+    slot_from = request.query_params.get('time_slot_from')
+    slot_to = request.query_params.get('time_slot_to')
+    busy = None
+    if slot_from or slot_to:
+        try:
+            slot_start = parse_datetime(slot_from or '')
+            slot_end = parse_datetime(slot_to or '')
+        except ValueError:
+            slot_start = slot_end = None
+        if not slot_start or not slot_end:
+            return Response({'error': 'Invalid time slot'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(slot_start):
+            slot_start = timezone.make_aware(slot_start)
+        if timezone.is_naive(slot_end):
+            slot_end = timezone.make_aware(slot_end)
+        if slot_start >= slot_end:
+            return Response({'error': 'time_slot_from must be before time_slot_to'}, status=status.HTTP_400_BAD_REQUEST)
+        busy = Booking.objects.busy_therapist_ids(slot_start, slot_end)
     
-    for loc in locations:
-        if loc.latitude is None or loc.longitude is None:
-            continue
-        
-        distance = haversine(user_lat, user_lon, float(loc.latitude), float(loc.longitude))
-        
-        if distance <= search_radius and distance <= float(loc.service_radius):
-            therapist = loc.user
-            serv_obj = TherapistServices.objects.filter(user=therapist).first()
-            data = {
-                'id': therapist.id,
-                'name': therapist.name, 
-                'email': therapist.email,
-                'address': loc.address,
-                'distance': round(distance, 2),
-                'services': serv_obj.services if serv_obj else []
-            }
-            results.append(data)
+    fetch = limit + 1 if paginate else None
+    if settings.THERAPIST_SEARCH_SNAPSHOT:
+        exclude = set(busy) if busy is not None else None
+        results = get_search_snapshot().search(user_lat, user_lon, search_radius, service_list, fetch, after, exclude)
+    else:
+        results = search_database(user_lat, user_lon, search_radius, service_list, fetch, after, busy)
     
-    serializer = TherapistDetailSerializer(results, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    if not paginate:
+        serializer = TherapistDetailSerializer(results, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    page = results[:limit]
+    next_cursor = encode_cursor(page[-1]['distance'], page[-1]['id']) if len(results) > limit else None
+    serializer = TherapistDetailSerializer(page, many=True)
+    return Response({'results': serializer.data, 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
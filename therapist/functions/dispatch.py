@@ -0,0 +1,127 @@
+import logging
+import uuid
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from customer.models import Booking, ACTIVE_BOOKING_STATUSES
+from therapist.models import Location, Order, Services, TherapistService
+from therapist.functions.geo import bounding_box_filter, within_radius
+
+logger = logging.getLogger(__name__)
+
+OPEN_ORDER_STATUSES = ['pending', 'accepted', 'started']
+
+def requested_services(services):
+    valid = dict(Services.SERVICE_CHOICES)
+    codes = services.keys() if isinstance(services, dict) else services if isinstance(services, list) else []
+    return sorted({code for code in codes if isinstance(code, str) and code in valid})
+
+def booking_uuid(value):
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+def rank_bookings(requests):
+    if not requests:
+        return {}
+    radius = settings.DISPATCH_RADIUS_KM
+    area = Q()
+    for booking, _ in requests:
+        area |= bounding_box_filter(float(booking.latitude), float(booking.longitude), radius)
+    all_codes = sorted({code for _, codes in requests for code in codes})
+    rows = list(Location.objects.filter(
+        area,
+        user_id__in=TherapistService.objects.filter(service__in=all_codes).values('user_id'),
+        user__role='therapist',
+        user__verification_status=True,
+        user__is_active=True,
+    ).values_list('user_id', 'latitude', 'longitude', 'service_radius'))
+    if not rows:
+        return {}
+    user_ids = [row[0] for row in rows]
+    offered = {}
+    for user_id, service in TherapistService.objects.filter(user_id__in=user_ids, service__in=all_codes).values_list('user_id', 'service'):
+        offered.setdefault(user_id, set()).add(service)
+    busy_rows = list(
+        Booking.objects.overlapping(min(b.time_slot_from for b, _ in requests), max(b.time_slot_to for b, _ in requests))
+        .filter(therapist_id__in=user_ids)
+        .values_list('id', 'therapist_id', 'time_slot_from', 'time_slot_to')
+    )
+    now = timezone.now()
+    load = dict(
+        Booking.objects.filter(therapist_id__in=user_ids, status__in=ACTIVE_BOOKING_STATUSES, time_slot_to__gte=now)
+        .order_by()
+        .values('therapist_id')
+        .annotate(n=Count('id'))
+        .values_list('therapist_id', 'n')
+    )
+    coords = np.array([row[1:] for row in rows], dtype=np.float64)
+    ranking = {}
+    for booking, codes in requests:
+        wanted = set(codes)
+        busy = {
+            therapist_id for booking_id, therapist_id, slot_from, slot_to in busy_rows
+            if booking_id != booking.id and slot_from < booking.time_slot_to and booking.time_slot_from < slot_to
+        }
+        mask, distances = within_radius(float(booking.latitude), float(booking.longitude), coords[:, 0], coords[:, 1], radius, coords[:, 2])
+        candidates = {
+            user_ids[i]: float(distances[i]) for i in np.flatnonzero(mask)
+            if wanted <= offered.get(user_ids[i], set()) and user_ids[i] not in busy
+        }
+        own_load = booking.therapist_id if booking.status in ACTIVE_BOOKING_STATUSES and booking.time_slot_to >= now else None
+        ranked = sorted(candidates, key=lambda user_id: (
+            user_id != booking.therapist_id,
+            load.get(user_id, 0) - (user_id == own_load),
+            candidates[user_id],
+            user_id,
+        ))
+        ranking[booking.id] = ranked[:settings.DISPATCH_FANOUT]
+    return ranking
+
+def dispatch_events(events):
+    created, cancelled = [], []
+    for event in events:
+        if not isinstance(event, dict) or not event.get('booking_id'):
+            continue
+        booking_id = booking_uuid(event['booking_id'])
+        if booking_id is None:
+            logger.warning("Skipping dispatch event with invalid booking_id %r", event['booking_id'])
+            continue
+        if event.get('event') == 'booking_cancelled':
+            cancelled.append(booking_id)
+        else:
+            created.append(booking_id)
+
+    cancelled_count = 0
+    if cancelled:
+        cancelled_count = (
+            Order.objects.filter(booking_id__in=cancelled, booking__status='cancelled', status__in=OPEN_ORDER_STATUSES)
+            .update(status='cancelled', cancelled_at=timezone.now())
+        )
+
+    dispatched = set(Order.objects.filter(booking_id__in=created).values_list('booking_id', flat=True).distinct())
+    requests = []
+    for booking in Booking.objects.filter(id__in=created, status='pending').exclude(id__in=dispatched):
+        codes = requested_services(booking.services)
+        if booking.latitude is None or booking.longitude is None or not codes:
+            continue
+        requests.append((booking, codes))
+
+    ranking = rank_bookings(requests)
+    orders = []
+    for booking, codes in requests:
+        for therapist_id in ranking.get(booking.id, []):
+            orders.append(Order(
+                therapist_id=therapist_id,
+                client_id=booking.customer_id,
+                booking=booking,
+                service_type=','.join(codes),
+                price=booking.total,
+                address=booking.address or '',
+                latitude=booking.latitude,
+                longitude=booking.longitude,
+            ))
+    Order.objects.bulk_create(orders, ignore_conflicts=True)
+    return len(orders), cancelled_count
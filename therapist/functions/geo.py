@@ -0,0 +1,52 @@
+import math
+import numpy as np
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+def bounding_box(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+def bounding_box_filter(lat, lon, radius_km, lat_field='latitude', lon_field='longitude'):
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    query = Q(**{f'{lat_field}__range': (min_lat, max_lat)})
+    if min_lon < -180:
+        lon_query = Q(**{f'{lon_field}__gte': min_lon + 360}) | Q(**{f'{lon_field}__lte': max_lon})
+    elif max_lon > 180:
+        lon_query = Q(**{f'{lon_field}__gte': min_lon}) | Q(**{f'{lon_field}__lte': max_lon - 360})
+    else:
+        lon_query = Q(**{f'{lon_field}__range': (min_lon, max_lon)})
+    return query & lon_query
+
+def haversine_many(lat, lon, lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    phi1 = math.radians(lat)
+    dphi = lats - phi1
+    dlambda = lons - math.radians(lon)
+    a = np.sin(dphi/2)**2 + math.cos(phi1)*np.cos(lats)*np.sin(dlambda/2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def within_radius(lat, lon, lats, lons, radius_km, service_radii=None):
+    distances = haversine_many(lat, lon, lats, lons)
+    mask = distances <= radius_km
+    if service_radii is not None:
+        mask &= distances <= np.asarray(service_radii, dtype=np.float64)
+    return mask, distances
@@ -0,0 +1,71 @@
+from decimal import Decimal
+from django.db import connection, transaction
+from django.utils import timezone
+from customer.models import Booking, OutboxEvent
+from therapist.models import Order, Earnings
+
+PLATFORM_FEE = Decimal('0.20')
+
+TRANSITIONS = {
+    'accept': (['pending'], 'accepted', 'accepted_at'),
+    'start': (['accepted'], 'started', 'started_at'),
+    'complete': (['started'], 'completed', 'completed_at'),
+    'cancel': (['pending', 'accepted'], 'cancelled', 'cancelled_at'),
+}
+
+BOOKING_TRANSITIONS = {
+    'start': ('active', 'started', 'started_at'),
+    'complete': ('started', 'completed', 'completed_at'),
+}
+
+class TransitionConflict(Exception):
+    pass
+
+def transition_sql(timestamp_field):
+    qn = connection.ops.quote_name
+    meta = Order._meta
+    columns = ', '.join(qn(field.column) for field in meta.concrete_fields)
+    return (
+        f"UPDATE {qn(meta.db_table)} "
+        f"SET {qn('status')} = %s, {qn(meta.get_field(timestamp_field).column)} = %s "
+        f"WHERE {qn('id')} = %s AND {qn(meta.get_field('therapist').column)} = %s AND {qn('status')} = ANY(%s) "
+        f"RETURNING {columns}"
+    )
+
+def transition_order(order_id, therapist, action):
+    expected, new_status, timestamp_field = TRANSITIONS[action]
+    now = timezone.now()
+    with transaction.atomic():
+        orders = list(Order.objects.raw(transition_sql(timestamp_field), [new_status, now, str(order_id), therapist.pk, expected]))
+        if not orders:
+            return None
+        order = orders[0]
+        if action == 'accept' and order.booking_id:
+            claimed = Booking.objects.filter(id=order.booking_id, status='pending').update(status='active', therapist=therapist)
+            if not claimed:
+                raise TransitionConflict()
+            Order.objects.filter(booking_id=order.booking_id, status='pending').exclude(id=order.id).update(status='cancelled', cancelled_at=now)
+        elif order.booking_id and action in BOOKING_TRANSITIONS:
+            booking_from, booking_to, booking_timestamp = BOOKING_TRANSITIONS[action]
+            moved = Booking.objects.filter(id=order.booking_id, status=booking_from, therapist=therapist).update(status=booking_to, **{booking_timestamp: now})
+            if not moved:
+                raise TransitionConflict()
+        elif order.booking_id and action == 'cancel':
+            dropped = Booking.objects.filter(id=order.booking_id, status='active', therapist=therapist).update(
+                status='cancelled',
+                cancelled_at=now,
+                cancellation_reason='The therapist cancelled the accepted order.'
+            )
+            if dropped:
+                data = {'event': 'booking_cancelled', 'booking_id': str(order.booking_id), 'customer_id': order.client_id}
+                OutboxEvent.objects.create(topic='service_requests', key=str(order.booking_id), payload=data)
+        if action == 'complete':
+            fee = order.price * PLATFORM_FEE
+            Earnings.objects.create(
+                user=therapist,
+                order=order,
+                amount=order.price,
+                platform_fee=fee,
+                net_amount=order.price - fee
+            )
+    return order
@@ -0,0 +1,135 @@
+import base64
+import heapq
+import json
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from therapist.models import Location, Services, TherapistService
+from therapist.functions.geo import within_radius
+
+VERSION_KEY = 'therapist_search_snapshot_version'
+
+def catalog_by_user(user_ids):
+    catalog = {}
+    for entry in TherapistService.objects.filter(user_id__in=list(user_ids)):
+        catalog.setdefault(entry.user_id, {})[entry.service] = entry.as_dict()
+    return catalog
+
+def codes_by_user(user_ids):
+    codes = {}
+    for user_id, service in TherapistService.objects.filter(user_id__in=list(user_ids)).values_list('user_id', 'service'):
+        codes.setdefault(user_id, []).append(service)
+    return codes
+
+def listings_by_user(user_ids):
+    return dict(Services.objects.filter(user_id__in=list(user_ids)).values_list('user_id', 'services'))
+
+class SearchSnapshot:
+    def __init__(self, rows, codes, listings, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.user_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.coords = np.array([row[1:4] for row in rows], dtype=np.float64).reshape(-1, 3)
+        self.details = [(row[4], row[5], row[6]) for row in rows]
+        self.services = [listings.get(row[0], []) for row in rows]
+        self.positions = {user_id: i for i, user_id in enumerate(self.user_ids.tolist())}
+        index = {}
+        for i, row in enumerate(rows):
+            for code in codes.get(row[0], ()):
+                index.setdefault(code, []).append(i)
+        self.service_index = {code: np.array(positions, dtype=np.int64) for code, positions in index.items()}
+
+    @classmethod
+    def build(cls, version):
+        rows = list(Location.objects.filter(
+            user__role='therapist',
+            user__verification_status=True,
+            user__is_active=True,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('user_id', 'latitude', 'longitude', 'service_radius', 'address', 'user__name', 'user__email'))
+        user_ids = [row[0] for row in rows]
+        return cls(rows, codes_by_user(user_ids), listings_by_user(user_ids), version)
+
+    def __contains__(self, user_id):
+        return user_id in self.positions
+
+    def is_stale(self, version):
+        return version != self.version or time.monotonic() - self.built_at > settings.THERAPIST_SEARCH_SNAPSHOT_TTL
+
+    def candidates(self, service_list):
+        hits = [self.service_index[code] for code in service_list if code in self.service_index]
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(hits))
+
+    def search(self, lat, lon, radius, service_list, limit=None, after=None, exclude=None):
+        positions = self.candidates(service_list)
+        if exclude:
+            positions = positions[~np.isin(self.user_ids[positions], np.fromiter(exclude, dtype=np.int64))]
+        coords = self.coords[positions]
+        mask, distances = within_radius(lat, lon, coords[:, 0], coords[:, 1], radius, coords[:, 2])
+        positions = positions[mask]
+        candidates = zip(distances[mask].tolist(), self.user_ids[positions].tolist(), positions.tolist())
+        results = []
+        for distance, user_id, position in select_nearest(candidates, limit, after):
+            address, name, email = self.details[position]
+            results.append({
+                'id': user_id,
+                'name': name,
+                'email': email,
+                'address': address,
+                'distance': distance,
+                'services': self.services[position]
+            })
+        return results
+
+def select_nearest(candidates, limit=None, after=None):
+    if after is not None:
+        candidates = (c for c in candidates if (c[0], c[1]) > after)
+    if limit is None:
+        return sorted(candidates)
+    return heapq.nsmallest(limit, candidates)
+
+def encode_cursor(distance, user_id):
+    return base64.urlsafe_b64encode(json.dumps([distance, user_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        distance, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(distance), int(user_id)
+    except (ValueError, TypeError):
+        return None
+
+_snapshot = None
+_lock = threading.Lock()
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+def get_search_snapshot():
+    global _snapshot
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot is not None and not snapshot.is_stale(version):
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.is_stale(version):
+            _snapshot = SearchSnapshot.build(version)
+        return _snapshot
+
+def invalidate_search_snapshot():
+    global _snapshot
+    _snapshot = None
+    if not cache.add(VERSION_KEY, 1, timeout=None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+
+def in_search_snapshot(user_id):
+    snapshot = _snapshot
+    return snapshot is not None and user_id in snapshot
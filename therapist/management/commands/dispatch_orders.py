@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from therapist.functions.dispatch import dispatch_events
+from User.functions.kafka_consumer import build_consumer
+
+class Command(BaseCommand):
+    help = 'Consumes service_requests in batches and offers each booking to the best matching therapists. Run one worker per partition to scale out.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topic', default='service_requests')
+        parser.add_argument('--group-id', default='dispatch')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--poll-timeout', type=int, default=1000, help='Poll timeout in milliseconds.')
+        parser.add_argument('--once', action='store_true', help='Exit once no more events are available.')
+
+    def handle(self, *args, **options):
+        consumer = build_consumer(options['topic'], options['group_id'], max_poll_records=options['batch_size'])
+        try:
+            while True:
+                batches = consumer.poll(timeout_ms=options['poll_timeout'], max_records=options['batch_size'])
+                events = [record.value for records in batches.values() for record in records]
+                if not events:
+                    if options['once']:
+                        break
+                    continue
+                started = time.monotonic()
+                created, cancelled = dispatch_events(events)
+                consumer.commit()
+                self.stdout.write(f'Processed {len(events)} events: {created} orders offered, {cancelled} cancelled in {time.monotonic() - started:.2f}s.')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            consumer.close()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from therapist.models import Services
+from therapist.functions.search_index import invalidate_search_snapshot
+
+class Command(BaseCommand):
+    help = 'Rebuilds the normalized therapist service catalog from the Services JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        synced = 0
+        for services in Services.objects.order_by('id').iterator(chunk_size=options['batch_size']):
+            services.sync_catalog()
+            synced += 1
+        invalidate_search_snapshot()
+        self.stdout.write(self.style.SUCCESS(f'Synced service catalog for {synced} therapists.'))
@@ -1,15 +1,23 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from decimal import Decimal, InvalidOperation
 import uuid
 
+MAX_SERVICE_PRICE = Decimal('100000000')
+MAX_SERVICE_DURATION = 2147483647
+
 class Location(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='therapist_location')
     address = models.TextField()
     service_radius = models.DecimalField(max_digits=5, decimal_places=2, help_text="Service radius in kilometers")
-    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
-    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, db_index=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, db_index=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
 
 class Pictures(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='therapist_pictures')
@@ -32,6 +40,65 @@ class Services(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='therapist_services')
     services = models.JSONField(blank=True, default=dict)
 
+    def catalog_entries(self):
+        valid = dict(self.SERVICE_CHOICES)
+        if isinstance(self.services, list):
+            items = [(code, None) for code in self.services]
+        elif isinstance(self.services, dict):
+            items = self.services.items()
+        else:
+            items = []
+        entries = {}
+        for code, value in items:
+            if not isinstance(code, str) or code not in valid:
+                continue
+            if isinstance(value, dict):
+                price, duration = value.get('price'), value.get('duration')
+            else:
+                price, duration = value, None
+            try:
+                price = Decimal(str(price)).quantize(Decimal('0.01')) if price not in (None, '') else None
+            except InvalidOperation:
+                price = None
+            if price is not None and not (price.is_finite() and 0 <= price < MAX_SERVICE_PRICE):
+                price = None
+            try:
+                duration = int(duration) if duration not in (None, '') else None
+            except (TypeError, ValueError):
+                duration = None
+            if duration is not None and not 0 < duration <= MAX_SERVICE_DURATION:
+                duration = None
+            entries[code] = TherapistService(user_id=self.user_id, service=code, price=price, duration=duration)
+        return entries
+
+    def sync_catalog(self):
+        entries = self.catalog_entries()
+        with transaction.atomic():
+            TherapistService.objects.filter(user_id=self.user_id).exclude(service__in=list(entries)).delete()
+            TherapistService.objects.bulk_create(
+                entries.values(),
+                update_conflicts=True,
+                unique_fields=['user', 'service'],
+                update_fields=['price', 'duration'],
+            )
+
+class TherapistService(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='service_catalog')
+    service = models.CharField(max_length=20, choices=Services.SERVICE_CHOICES)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    duration = models.PositiveIntegerField(null=True, blank=True, help_text="Duration in minutes")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'service'], name='unique_therapist_service'),
+        ]
+        indexes = [
+            models.Index(fields=['service', 'user']),
+        ]
+
+    def as_dict(self):
+        return {'price': self.price, 'duration': self.duration}
+
 class BankDetails(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='therapist_bank_details')
     bank_name = models.CharField(max_length=255)
@@ -49,7 +116,8 @@ class Order(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     therapist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='therapist_orders')
     client = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='client_orders')
-    service_type = models.CharField(max_length=50)
+    booking = models.ForeignKey('customer.Booking', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    service_type = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     address = models.TextField()
@@ -65,6 +133,9 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['booking', 'therapist'], name='unique_booking_therapist_order'),
+        ]
 
 class Earnings(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='earnings')
@@ -1,7 +1,9 @@
+from decimal import Decimal
 from rest_framework import serializers
 from .models import Location, Pictures, Services, BankDetails, Order, TherapistReview
 from User.serializers import UserMinimalSerializer
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Avg
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -14,10 +16,40 @@ class PicturesSerializer(serializers.ModelSerializer):
         model = Pictures
         fields = ['profile_picture', 'more_pictures', 'certificate', 'national_id']
 
+SERVICE_PRICE = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), allow_null=True)
+SERVICE_DURATION = serializers.IntegerField(min_value=1, max_value=2147483647, allow_null=True)
+
 class ServicesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Services
         fields = ['services']
+    def validate_services(self, value):
+        if not isinstance(value, (dict, list)):
+            raise serializers.ValidationError("Services must be an object keyed by service code or a list of service codes.")
+        if isinstance(value, list) and not all(isinstance(code, str) for code in value):
+            raise serializers.ValidationError("Service codes must be strings.")
+        valid = dict(Services.SERVICE_CHOICES)
+        unknown = [code for code in value if code not in valid]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown service codes: {', '.join(unknown)}")
+        if isinstance(value, dict):
+            errors = {}
+            for code, details in value.items():
+                if isinstance(details, dict):
+                    price, duration = details.get('price'), details.get('duration')
+                elif details is None or isinstance(details, (str, int, float)) and not isinstance(details, bool):
+                    price, duration = details, None
+                else:
+                    errors[code] = ["Expected a price or an object with price and duration."]
+                    continue
+                try:
+                    SERVICE_PRICE.run_validation(None if price == '' else price)
+                    SERVICE_DURATION.run_validation(None if duration == '' else duration)
+                except serializers.ValidationError as exc:
+                    errors[code] = exc.detail
+            if errors:
+                raise serializers.ValidationError(errors)
+        return value
 
 class BankDetailsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -30,6 +62,7 @@ class TherapistProfileSerializer(serializers.Serializer):
     services = ServicesSerializer(required=False)
     bank_details = BankDetailsSerializer(required=False)
     
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
         if 'location' in validated_data:
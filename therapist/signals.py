@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Location, Services, TherapistService
+from .functions.search_index import invalidate_search_snapshot, in_search_snapshot
+
+@receiver([post_save, post_delete], sender=Location)
+def therapist_location_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_search_snapshot)
+
+@receiver(post_save, sender=Services)
+def therapist_services_saved(sender, instance, **kwargs):
+    instance.sync_catalog()
+    transaction.on_commit(invalidate_search_snapshot)
+
+@receiver(post_delete, sender=Services)
+def therapist_services_deleted(sender, instance, **kwargs):
+    TherapistService.objects.filter(user_id=instance.user_id).delete()
+    transaction.on_commit(invalidate_search_snapshot)
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def therapist_profile_changed(sender, instance, **kwargs):
+    if instance.role == 'therapist' or in_search_snapshot(instance.pk):
+        transaction.on_commit(invalidate_search_snapshot)
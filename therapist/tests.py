@@ -1,3 +1,203 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from customer.models import Booking
+from User.functions.kafka_producer import InMemoryProducer, set_producer
+from .models import Earnings, Location, Order, TherapistService
+from .functions.dispatch import dispatch_events
+from .functions.geo import bounding_box, haversine
+from .functions.order_state import TransitionConflict, transition_order
+from .serializers import ServicesSerializer
 
-# Create your tests here.
+CENTER = (Decimal('25.204800'), Decimal('55.270800'))
+
+class BoundingBoxTests(SimpleTestCase):
+    def test_box_contains_every_point_within_the_radius(self):
+        radius = 10
+        for lat in (0.0, 25.2048, 60.0, -45.0):
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, 55.2708, radius)
+            edges = {
+                'north': (max_lat, 55.2708),
+                'south': (min_lat, 55.2708),
+                'east': (lat, max_lon),
+                'west': (lat, min_lon),
+            }
+            for side, (edge_lat, edge_lon) in edges.items():
+                with self.subTest(lat=lat, side=side):
+                    self.assertGreaterEqual(haversine(lat, 55.2708, edge_lat, edge_lon), radius - 1e-6)
+
+class ServicesSerializerTests(SimpleTestCase):
+    def errors(self, services):
+        serializer = ServicesSerializer(data={'services': services})
+        serializer.is_valid()
+        return serializer.errors.get('services')
+
+    def test_accepts_codes_and_priced_services(self):
+        self.assertIsNone(self.errors(['oil', 'foot']))
+        self.assertIsNone(self.errors({'oil': '120.50', 'foot': {'price': 80, 'duration': 45}, 'thai': None}))
+
+    def test_rejects_non_string_codes(self):
+        self.assertIsNotNone(self.errors([{'code': 'oil'}]))
+
+    def test_rejects_invalid_prices_and_durations(self):
+        for services in ({'oil': 'abc'}, {'oil': -1}, {'oil': 1e12}, {'oil': 'NaN'}, {'oil': [1]}, {'oil': {'price': 10, 'duration': 0}}):
+            with self.subTest(services=services):
+                self.assertIsNotNone(self.errors(services))
+
+@override_settings(KAFKA_BACKEND='memory', DISPATCH_RADIUS_KM=15, DISPATCH_FANOUT=3)
+class DispatchOrdersTests(TestCase):
+    def setUp(self):
+        self.producer = InMemoryProducer()
+        set_producer(self.producer)
+        self.addCleanup(set_producer, None)
+        self.customer = self.user('Customer', 'customer')
+        self.slot = timezone.now() + timedelta(days=1)
+
+    def user(self, name, role):
+        return get_user_model().objects.create_user(name, email=f'{name.lower()}@roomspa.test', password='secret', role=role, verification_status=True)
+
+    def therapist(self, name, services, offset=Decimal('0.01')):
+        user = self.user(name, 'therapist')
+        Location.objects.create(user=user, address='Dubai', service_radius=Decimal('20'), latitude=CENTER[0] + offset, longitude=CENTER[1])
+        for service in services:
+            TherapistService.objects.create(user=user, service=service, price=Decimal('100'), duration=60)
+        return user
+
+    def booking(self, therapist, services, status='pending', start=None):
+        start = start or self.slot
+        return Booking.objects.create(
+            customer=self.customer,
+            therapist=therapist,
+            time_slot_from=start,
+            time_slot_to=start + timedelta(hours=1),
+            services=services,
+            total=Decimal('100'),
+            status=status,
+            latitude=CENTER[0],
+            longitude=CENTER[1],
+        )
+
+    def publish(self, *events):
+        for event in events:
+            self.producer.send('service_requests', value=event, key=event.get('booking_id'))
+
+    def run_dispatch(self):
+        call_command('dispatch_orders', '--once', '--poll-timeout', '0', stdout=io.StringIO())
+
+    def offered(self, booking):
+        return set(Order.objects.filter(booking=booking).values_list('therapist_id', flat=True))
+
+    def test_offers_booking_to_nearby_therapists_offering_every_service(self):
+        match = self.therapist('Match', ['oil', 'foot'])
+        self.therapist('Partial', ['oil'])
+        self.therapist('Far', ['oil', 'foot'], offset=Decimal('1.0'))
+        booking = self.booking(match, ['oil', 'foot'])
+        self.publish({'event': 'booking_created', 'booking_id': str(booking.id)})
+        self.run_dispatch()
+        self.assertEqual(self.offered(booking), {match.id})
+        self.assertEqual(self.producer.committed[('dispatch', 'service_requests')], 1)
+
+    def test_skips_therapists_busy_in_the_slot(self):
+        free = self.therapist('Free', ['oil'])
+        busy = self.therapist('Busy', ['oil'])
+        self.booking(busy, ['oil'], status='active', start=self.slot + timedelta(minutes=30))
+        booking = self.booking(free, ['oil'])
+        self.publish({'event': 'booking_created', 'booking_id': str(booking.id)})
+        self.run_dispatch()
+        self.assertEqual(self.offered(booking), {free.id})
+
+    def test_invalid_booking_id_is_skipped_and_committed(self):
+        therapist = self.therapist('Therapist', ['oil'])
+        booking = self.booking(therapist, ['oil'])
+        self.publish({'event': 'booking_created', 'booking_id': 'not-a-uuid'}, {'event': 'booking_created', 'booking_id': str(booking.id)})
+        self.run_dispatch()
+        self.assertEqual(self.offered(booking), {therapist.id})
+        self.assertEqual(self.producer.committed[('dispatch', 'service_requests')], 2)
+
+    def test_undecodable_record_is_skipped_and_committed(self):
+        therapist = self.therapist('Therapist', ['oil'])
+        booking = self.booking(therapist, ['oil'])
+        self.producer.topics['service_requests'].append((None, b'\xffnot json'))
+        self.publish({'event': 'booking_created', 'booking_id': str(booking.id)})
+        with self.assertLogs('User.functions.kafka_consumer', 'WARNING'):
+            self.run_dispatch()
+        self.assertEqual(self.offered(booking), {therapist.id})
+        self.assertEqual(self.producer.committed[('dispatch', 'service_requests')], 2)
+
+    def test_cancel_event_withdraws_open_offers(self):
+        therapist = self.therapist('Therapist', ['oil'])
+        other = self.therapist('Other', ['oil'])
+        booking = self.booking(therapist, ['oil'])
+        self.publish({'event': 'booking_created', 'booking_id': str(booking.id)})
+        self.run_dispatch()
+        Order.objects.filter(booking=booking, therapist=other).update(status='accepted')
+        Booking.objects.filter(id=booking.id).update(status='cancelled')
+        self.publish({'event': 'booking_cancelled', 'booking_id': str(booking.id)})
+        self.run_dispatch()
+        self.assertEqual(set(Order.objects.filter(booking=booking).values_list('status', flat=True)), {'cancelled'})
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        therapists = [self.therapist(f'Therapist{i}', ['oil']) for i in range(3)]
+        single = [self.booking(therapists[0], ['oil'])]
+        batch = [self.booking(therapist, ['oil'], start=self.slot + timedelta(days=i + 1)) for i, therapist in enumerate(therapists)]
+        with CaptureQueriesContext(connection) as one:
+            dispatch_events([{'event': 'booking_created', 'booking_id': str(b.id)} for b in single])
+        with CaptureQueriesContext(connection) as many:
+            dispatch_events([{'event': 'booking_created', 'booking_id': str(b.id)} for b in batch])
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(Order.objects.filter(booking__in=batch).count(), 9)
+
+class OrderStateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.customer = User.objects.create_user('Customer', email='customer@roomspa.test', password='secret', role='customer', verification_status=True)
+        self.first = User.objects.create_user('First', email='first@roomspa.test', password='secret', role='therapist', verification_status=True)
+        self.second = User.objects.create_user('Second', email='second@roomspa.test', password='secret', role='therapist', verification_status=True)
+        start = timezone.now() + timedelta(days=1)
+        self.booking = Booking.objects.create(customer=self.customer, therapist=self.first, time_slot_from=start, time_slot_to=start + timedelta(hours=1), services=['oil'], total=Decimal('100'))
+        self.orders = {
+            therapist: Order.objects.create(therapist=therapist, client=self.customer, booking=self.booking, service_type='oil', price=Decimal('100'), address='Dubai', latitude=CENTER[0], longitude=CENTER[1])
+            for therapist in (self.first, self.second)
+        }
+
+    def status(self, obj):
+        obj.refresh_from_db()
+        return obj.status
+
+    def test_only_one_therapist_can_accept(self):
+        self.assertIsNotNone(transition_order(self.orders[self.first].id, self.first, 'accept'))
+        self.assertIsNone(transition_order(self.orders[self.first].id, self.first, 'accept'))
+        self.assertEqual(self.status(self.orders[self.second]), 'cancelled')
+        Order.objects.filter(id=self.orders[self.second].id).update(status='pending')
+        with self.assertRaises(TransitionConflict):
+            transition_order(self.orders[self.second].id, self.second, 'accept')
+        self.assertEqual(self.status(self.orders[self.second]), 'pending')
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.therapist_id), ('active', self.first.id))
+
+    def test_completing_twice_writes_earnings_once(self):
+        order = self.orders[self.first]
+        for action in ('accept', 'start', 'complete'):
+            self.assertIsNotNone(transition_order(order.id, self.first, action))
+        self.assertIsNone(transition_order(order.id, self.first, 'complete'))
+        self.assertEqual(Earnings.objects.filter(order=order).count(), 1)
+        self.assertEqual(self.status(self.booking), 'completed')
+
+    def test_start_after_customer_cancelled_booking_conflicts(self):
+        order = self.orders[self.first]
+        transition_order(order.id, self.first, 'accept')
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.post(reverse('cancel_booking', args=[self.booking.id])).status_code, 200)
+        with self.assertRaises(TransitionConflict):
+            transition_order(order.id, self.first, 'start')
+        self.assertEqual(self.status(self.booking), 'cancelled')
+        self.assertEqual(self.status(order), 'accepted')
@@ -4,9 +4,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Sum, Count, Q, Avg
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
-from decimal import Decimal
 import datetime
 import os
 from django.shortcuts import get_object_or_404
@@ -16,6 +16,7 @@ from chat.models import Conversation, Message
 from .serializers import LocationSerializer, PicturesSerializer, ServicesSerializer, BankDetailsSerializer, TherapistProfileSerializer, OrderSerializer, OrderUpdateSerializer, TherapistReviewSerializer, TherapistReviewSummarySerializer
 from chat.serializers import ConversationSerializer, MessageSerializer
 from User.functions.image_handler import upload_image
+from .functions.order_state import transition_order, TransitionConflict
 
 def handle_uploaded_file(file, subfolder):
     file_path = os.path.join(settings.MEDIA_ROOT, file.name)
@@ -118,7 +119,8 @@ def services_view(request):
         instance = Services.objects.filter(user=request.user).first()
         serializer = ServicesSerializer(instance, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            with transaction.atomic():
+                serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED if not instance else status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -181,48 +183,45 @@ def update_order_view(request, order_id):
 @api_view(['POST'])
 @permission_classes([IsTherapist])
 def accept_order_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, therapist=request.user, status='pending')
-    order.status = 'accepted'
-    order.accepted_at = timezone.now()
-    order.save()
+    try:
+        order = transition_order(order_id, request.user, 'accept')
+    except TransitionConflict:
+        return Response({"error": "The booking for this order can no longer be accepted"}, status=status.HTTP_409_CONFLICT)
+    if order is None:
+        return Response({"error": "Order not found or cannot be accepted"}, status=status.HTTP_404_NOT_FOUND)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsTherapist])
 def start_service_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, therapist=request.user, status='accepted')
-    order.status = 'started'
-    order.started_at = timezone.now()
-    order.save()
+    try:
+        order = transition_order(order_id, request.user, 'start')
+    except TransitionConflict:
+        return Response({"error": "The booking for this order can no longer be started"}, status=status.HTTP_409_CONFLICT)
+    if order is None:
+        return Response({"error": "Order not found or cannot be started"}, status=status.HTTP_404_NOT_FOUND)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsTherapist])
 def complete_order_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, therapist=request.user, status='started')
-    order.status = 'completed'
-    order.completed_at = timezone.now()
-    order.save()
-    fee = Decimal('0.20')
-    Earnings.objects.create(
-        user=request.user,
-        order=order,
-        amount=order.price,
-        platform_fee=order.price * fee,
-        net_amount=order.price - order.price * fee
-    )
+    try:
+        order = transition_order(order_id, request.user, 'complete')
+    except TransitionConflict:
+        return Response({"error": "The booking for this order can no longer be completed"}, status=status.HTTP_409_CONFLICT)
+    if order is None:
+        return Response({"error": "Order not found or cannot be completed"}, status=status.HTTP_404_NOT_FOUND)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsTherapist])
 def cancel_order_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id, therapist=request.user, status__in=['pending', 'accepted'])
-    order.status = 'cancelled'
-    order.cancelled_at = timezone.now()
-    order.save()
+    order = transition_order(order_id, request.user, 'cancel')
+    if order is None:
+        return Response({"error": "Order not found or cannot be cancelled"}, status=status.HTTP_404_NOT_FOUND)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 